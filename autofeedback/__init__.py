@@ -1,12 +1,63 @@
 # outer __init__.py
-from .feedback_generator import run_tests, autograde_notebooks
+"""
+Automatic feedback on jupyter notebook assignments. The test classes of
+'autofeedback.autotest' are imported eagerly, the grading functions and
+preprocessors are imported on first use. All of them are listed in __all__,
+so 'from autofeedback import *' loads the grading modules (nbgrader, nbconvert)
+as well; notebooks running hidden tests should import autofeedback or
+autofeedback.autotest instead.
+"""
+from importlib import import_module
 from .autotest import *
-from .preprocessors import TagPlotCells, PreservePlots, NoCellsDeletable, LockMarkdownCells, InsertHiddenTests
 
-__all__ = ["run_tests", 
+# Modules used on the grading host only (notebook execution and export, result
+# storage, nbgrader preprocessors) are imported on first use, so that importing
+# autofeedback in notebook kernels only loads the test classes.
+_lazy_imports = {"run_tests": ".feedback_generator",
+                 "collect_results": ".feedback_generator",
+                 "autograde_notebooks": ".feedback_generator",
+                 "grade_notebooks": ".feedback_generator",
+                 "run_tests_async": ".feedback_generator",
+                 "grade_notebooks_async": ".feedback_generator",
+                 "ResultsStore": ".results_store",
+                 "GradingJournal": ".journal",
+                 "watch_notebooks": ".watch",
+                 "NotebookArchive": ".archive",
+                 "TagPlotCells": ".preprocessors",
+                 "PreservePlots": ".preprocessors",
+                 "NoCellsDeletable": ".preprocessors",
+                 "LockMarkdownCells": ".preprocessors",
+                 "InsertHiddenTests": ".preprocessors",
+                 "BundleHiddenTests": ".preprocessors",
+                 "HashReferencePlots": ".preprocessors"}
+
+
+def __getattr__(name):
+    if name in _lazy_imports:
+        value = getattr(import_module(_lazy_imports[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_imports))
+
+
+__all__ = ["run_tests",
+           "collect_results",
            "autograde_notebooks",
-           "TagPlotCells", 
-           "PreservePlots", 
-           "NoCellsDeletable", 
-           "LockMarkdownCells", 
-           "InsertHiddenTests"]
\ No newline at end of file
+           "grade_notebooks",
+           "run_tests_async",
+           "grade_notebooks_async",
+           "ResultsStore",
+           "GradingJournal",
+           "watch_notebooks",
+           "NotebookArchive",
+           "TagPlotCells",
+           "PreservePlots",
+           "NoCellsDeletable",
+           "LockMarkdownCells",
+           "InsertHiddenTests",
+           "BundleHiddenTests",
+           "HashReferencePlots"]
@@ -0,0 +1,166 @@
+import os
+import copy
+import gzip
+import json
+import threading
+import nbformat
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File extensions of archived notebooks by compression format
+archive_extensions = {"gzip": ".ipynb.gz", "zstd": ".ipynb.zst"}
+
+
+def read_archived(path: str):
+    """
+    Function to read an archived notebook written by NotebookArchive.
+    """
+    if path.endswith(archive_extensions["zstd"]):
+        if zstandard is None:
+            raise ImportError("reading zstd archives requires the 'zstandard' package.")
+        with open(path, 'rb') as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            return nbformat.reads(reader.read().decode('utf-8'), as_version=4)
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return nbformat.read(f, as_version=4)
+
+
+class NotebookArchive:
+    """
+    Class to keep compressed copies of executed notebooks, with their outputs and
+    with hidden tests removed, so disputed grades can be checked without running
+    the notebook again. Notebooks are serialized, compressed and written by a
+    background thread while grading continues. If 'max_size' (bytes)
+    is given, the oldest archived notebooks are deleted once the archive grows
+    beyond it, using a size total kept from one scan of the archive directory.
+    Instances can be passed to worker processes. Copies in worker processes only
+    write notebooks; the original instance applies the size limit when the paths
+    written by the copies are passed to 'record'.
+    """
+
+    def __init__(self, archive_dir: str, max_size: int = None, compression: str = "gzip", chunk_size: int = 1 << 20):
+        if compression not in archive_extensions:
+            raise ValueError("unknown archive compression '%s'." % compression)
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression requires the 'zstandard' package.")
+        self.archive_dir = archive_dir
+        self.max_size = max_size
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self._executor = None
+        self._pending = []
+        self._lock = threading.Lock()
+        # Sizes of archived notebooks, oldest first
+        self._sizes = OrderedDict()
+        self._retain = max_size is not None
+        self.total = 0
+        if self._retain:
+            files = []
+            for root, _, names in os.walk(archive_dir):
+                for name in names:
+                    if name.endswith(tuple(archive_extensions.values())):
+                        stat = os.stat(os.path.join(root, name))
+                        files.append((stat.st_mtime_ns, stat.st_size, os.path.join(root, name)))
+            self._sizes.update((path, size) for _, size, path in sorted(files))
+            self.total = sum(self._sizes.values())
+
+    def __getstate__(self):
+        state = dict(self.__dict__, _executor=None, _pending=[], _sizes=OrderedDict(), _retain=False)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _lock=threading.Lock())
+
+    def path(self, notebook: str):
+        """
+        Returns the archive path of notebook file @notebook.
+        """
+        from .feedback_generator import report_path
+        return os.path.splitext(report_path(notebook, self.archive_dir))[0] + archive_extensions[self.compression]
+
+    def add(self, nb, notebook: str, copy_nb: bool = True):
+        """
+        Adds executed notebook @nb, read from file @notebook, to the archive. Returns
+        the archive path. With @copy_nb, the notebook is copied and may be changed
+        again as soon as this returns. Otherwise it is serialized as it is when the
+        background thread gets to it, and must not be changed until 'wait' returns.
+        """
+        if copy_nb:
+            nb = copy.deepcopy(nb)
+        path = self.path(notebook)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending.append((path, self._executor.submit(self._write, path, nb)))
+        return path
+
+    def _write(self, path: str, nb):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_name = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        encoder = json.JSONEncoder(sort_keys=True, indent=1, ensure_ascii=False)
+        with open(tmp_name, 'wb') as raw:
+            if self.compression == "zstd":
+                stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+            else:
+                stream = gzip.GzipFile(filename=os.path.basename(path)[:-3], mode='wb', fileobj=raw)
+            with stream:
+                # The JSON text is encoded piecewise and compressed in chunks of about
+                # 'chunk_size' characters, without holding the whole text in memory
+                chunk, length = [], 0
+                for piece in encoder.iterencode(nb):
+                    chunk.append(piece)
+                    length += len(piece)
+                    if length >= self.chunk_size:
+                        stream.write("".join(chunk).encode('utf-8'))
+                        chunk, length = [], 0
+                stream.write("".join(chunk).encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_name, path)
+        if self._retain:
+            self.record(path)
+
+    def record(self, path: str):
+        """
+        Adds the size of archived notebook @path, as the newest notebook, to the size
+        total, and deletes the oldest archived notebooks while the total exceeds 'max_size'.
+        """
+        if self.max_size is None:
+            return
+        with self._lock:
+            self.total -= self._sizes.pop(path, 0)
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                return
+            self._sizes[path] = size
+            self.total += size
+            while self.total > self.max_size and len(self._sizes) > 0:
+                oldest, size = self._sizes.popitem(last=False)
+                try:
+                    os.remove(oldest)
+                except FileNotFoundError:
+                    pass
+                self.total -= size
+
+    def wait(self):
+        """
+        Waits until all added notebooks are written. Returns a dictionary with the
+        error of each archive path that could not be written.
+        """
+        pending, self._pending = self._pending, []
+        errors = {}
+        for path, future in pending:
+            if future.exception() is not None:
+                errors[path] = future.exception()
+        return errors
+
+    def close(self):
+        self.wait()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -1,10 +1,11 @@
 # Autotest init file
-from .utils import print2str, args2str, compare_type, get_deviation, compare_values, compare_printout
+from .utils import print2str, args2str, compare_type, get_deviation, compare_values, compare_nested, compare_printout, sample_indices, compare_arrays, estimate_lag, compare_signals, fit_exponent, measure_scaling
 from .testclass import FeedbackLogger, ScoreCalculator, TestClass
 from .customtests import CustomTests
 from .variabletests import VariableTests
-from .codecelltests import CodeCellTests
+from .codecelltests import CodeCellTests, NamespaceSnapshot
 from .functiontests import FunctionTests
+from .plotchecker import PlotChecker, PlotData
 
 
 __all__ = ["print2str",
@@ -12,11 +13,21 @@ __all__ = ["print2str",
            "compare_type",
            "get_deviation",
            "compare_values",
+           "compare_nested",
            "compare_printout",
+           "sample_indices",
+           "compare_arrays",
+           "estimate_lag",
+           "compare_signals",
+           "fit_exponent",
+           "measure_scaling",
            "FeedbackLogger",
            "ScoreCalculator",
            "TestClass",
            "CustomTests",
            "VariableTests",
            "CodeCellTests",
-           "FunctionTests"]
\ No newline at end of file
+           "NamespaceSnapshot",
+           "FunctionTests",
+           "PlotChecker",
+           "PlotData"]
\ No newline at end of file
@@ -1,39 +1,185 @@
 from . import VariableTests, print2str
 import re
+import ast
+from copy import deepcopy
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
 from unittest.mock import patch
 
+# Prefix of the namespace entries holding values for substituted assignments
+_subst_prefix = "_autofeedback_subst_"
+
+
+class _SubstituteAssignments(ast.NodeTransformer):
+    """
+    Replaces the assigned value in assignments to the given variable names with a
+    reference to the corresponding substitution variable. Function and class bodies
+    are left untouched, as their assignments are to local names.
+    """
+
+    def __init__(self, names):
+        self.names = set(names)
+        self.found = set()
+
+    def _skip(self, node):
+        return node
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = visit_Lambda = _skip
+
+    def visit_Assign(self, node):
+        for target in node.targets:
+            if isinstance(target, ast.Name) and target.id in self.names:
+                self.found.add(target.id)
+                node.value = ast.Name(id=_subst_prefix + target.id, ctx=ast.Load())
+        return node
+
+    def visit_AnnAssign(self, node):
+        if isinstance(node.target, ast.Name) and node.target.id in self.names and node.value is not None:
+            self.found.add(node.target.id)
+            node.value = ast.Name(id=_subst_prefix + node.target.id, ctx=ast.Load())
+        return node
+
+
+@lru_cache(maxsize=64)
+def _compile_cell(source: str, names: tuple = ()):
+    """
+    Compiles code cell @source once per source version, with assignments to the
+    variables @names substituted. Returns the code object and the set of names
+    for which an assignment was found.
+    """
+    tree = ast.parse(source, "<answer cell>")
+    transformer = _SubstituteAssignments(names)
+    if len(names) > 0:
+        tree = ast.fix_missing_locations(transformer.visit(tree))
+    return compile(tree, "<answer cell>", "exec"), frozenset(transformer.found)
+
+
+class NamespaceSnapshot:
+    """
+    Class to record the bindings of a namespace dictionary, so that changes made by
+    code run inside 'track()' blocks can be undone. Only references are recorded,
+    and restoring only rebinds or deletes the names that the tracked code bound, so
+    names bound by other code are left alone, and temporary objects created by the
+    tracked code are released immediately. Objects changed in place are not
+    restored, unless their names are listed in @copy_names, in which case a deep
+    copy is recorded.
+    """
+
+    _missing = object()
+
+    def __init__(self, namespace: dict, copy_names=()):
+        self.namespace = namespace
+        self.bindings = dict(namespace)
+        self.copies = {name: deepcopy(namespace[name]) for name in copy_names if name in namespace}
+        self.names = set()
+
+    @contextmanager
+    def track(self):
+        """
+        Context manager recording the names bound, rebound or deleted by code run in the block.
+        """
+        before = dict(self.namespace)
+        try:
+            yield self
+        finally:
+            self.names.update(name for name, value in self.namespace.items()
+                              if before.get(name, self._missing) is not value)
+            self.names.update(before.keys() - self.namespace.keys())
+
+    def restore(self):
+        """
+        Restores the recorded bindings of all names changed by tracked code.
+        """
+        for name in self.names:
+            if name in self.bindings:
+                self.namespace[name] = self.bindings[name]
+            else:
+                self.namespace.pop(name, None)
+        self.names = set()
+        for name, value in self.copies.items():
+            self.namespace[name] = deepcopy(value)
+
 
 class CodeCellTests(VariableTests):
     """
     Test class to check execution and output of code cell.
+
+    Modifications made with 'replace', 'insert_top' and 'substitute' re-run the
+    cell immediately, unless they are made inside a 'batch()' block, in which
+    case the cell is run once when the block exits:
+    ----------------------
+    with test_obj.batch():
+        test_obj.substitute("N", 10)
+        test_obj.replace("plt.show()", "")
+    ----------------------
+
+    With 'isolate' set, the namespace is recorded after the unmodified cell is
+    first run, holding the student's own results. Every modified run then starts
+    from the recorded namespace, and the namespace is restored when 'get_results'
+    is called, so later cells are not affected by the modifications. Names in
+    'copy_names' are deep copied to also undo changes made in place.
     """
 
-    def __init__(self, code_cell_contents: str, init_wgt=1.0, globals=None, locals=None):
+    def __init__(self, code_cell_contents: str, init_wgt=1.0, globals=None, locals=None,
+                 isolate=False, copy_names=()):
         super().__init__()
         self.source = code_cell_contents
         self.globals = globals
         self.locals = locals
+        self.substitutions = {}
+        self._batch_depth = 0
+        self._pending = []
+        self.snapshot = None
+        namespace = self.locals if self.locals is not None else self.globals
+        assert namespace is not None or not isolate, "isolated code cell tests require a namespace ('globals')."
         self.test_exec(wgt=init_wgt)
+        if isolate:
+            self.snapshot = NamespaceSnapshot(namespace, copy_names)
+
+    def restore(self):
+        """
+        Restores the namespace recorded after the unmodified code cell was first run.
+        """
+        if self.snapshot is not None:
+            self.snapshot.restore()
+
+    def get_results(self):
+        self.restore()
+        return super().get_results()
+
+    def _track(self):
+        return self.snapshot.track() if self.snapshot is not None else nullcontext()
 
     def test_exec(self, wgt=1.0):
-        _, N_tests = self.score.get_ratio()
-        msg_intro = f"Test {N_tests + 1}"
+        """
+        Runs the (modified) code cell, recording the result as a test with weight @wgt.
+        Successful runs are not recorded for @wgt 0.0. Returns True if the cell ran
+        without errors.
+        """
         self.student_print = ""
         scope_name = __name__ if self.globals is None else self.globals["__name__"]
+        namespace = self.globals if self.globals is not None else globals()
         try:
-            with patch(f'{scope_name}.print') as mock_print:
-                exec(self.source, self.globals, self.locals)
+            code, _ = _compile_cell(self.source, tuple(sorted(self.substitutions)))
+            for name, value in self.substitutions.items():
+                namespace[_subst_prefix + name] = value
+            try:
+                with patch(f'{scope_name}.print') as mock_print, self._track():
+                    exec(code, self.globals, self.locals)
+            finally:
+                for name in self.substitutions:
+                    namespace.pop(_subst_prefix + name, None)
             for call in mock_print.mock_calls:
                 self.student_print += print2str(*call.args, **call.kwargs)
         except Exception as e:
             feedback = "answer cell could not execute: " + e.args[0]
-            self.score.process_result(False, wgt)
-            self.log.append(msg_intro + " failed: " + feedback)
+            self.add_result(False, feedback, wgt)
+            return False
         else:
             if wgt != 0.0:
                 feedback = "answer cell executed without errors"
-                self.score.process_result(True, wgt)
-                self.log.append(msg_intro + " passed: " + feedback)
+                self.add_result(True, feedback, wgt)
+            return True
 
     def test_output(self, desired_output: str, sample=None, wgt=1.0, ignore_code_match=True):
         passed = False
@@ -49,25 +195,62 @@ class CodeCellTests(VariableTests):
             else:
                 feedback = f"no match for '{sample if sample is not None else desired_output}' found in printed message."
 
-        _, N_tests = self.score.get_ratio()
-        msg_intro = f"Test {N_tests + 1}"
+        self.add_result(passed, feedback, wgt)
 
-        self.score.process_result(passed, wgt)
-        if passed:
-            self.log.append(msg_intro + " passed: " + feedback)
-        else:
-            self.log.append(msg_intro + " failed: " + feedback)
+    @contextmanager
+    def batch(self):
+        """
+        Context manager to collect several modifications of the code cell, and run
+        the modified cell only once when the block exits.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and len(self._pending) > 0:
+                self._run_modified()
+
+    def _modified(self, msg: str):
+        self._pending.append(msg)
+        if self._batch_depth == 0:
+            self._run_modified()
+
+    def _run_modified(self):
+        # Run modified code without scoring it, and log the adjustments made
+        n_results = len(self.score.test_results)
+        n_log = len(self.log)
+        self.restore()
+        executed = self.test_exec(wgt=0.0)
+        if len(self.score.test_results) > n_results:
+            self.score.pop(-1)
+            self.log.clear(start=n_log)
+        for msg in self._pending:
+            self.log.append(msg)
+        if not executed:
+            self.log.append("Adjusted code could not execute.")
+        self._pending = []
 
     def replace(self, pattern: str, replacement: str):
         self.source = re.sub(pattern, replacement, self.source)
-        self.test_exec(wgt=0.0)
-        self.score.pop(-1)
-        self.log.clear(start=-1)
-        self.log.append(f"Making adjustment to code: {replacement}")
-        # add code to remove logged score/message
-        # add check to see if code executed successfully
+        self._modified(f"Making adjustment to code: {replacement}")
 
     def insert_top(self, new_code):
         self.source = new_code + "\n" + self.source
-        self.test_exec(wgt=0.0)
-        self.log.append(f"Adding new code: {new_code}")
\ No newline at end of file
+        self._modified(f"Adding new code: {new_code}")
+
+    def substitute(self, name: str, value):
+        """
+        Replaces the value assigned to variable @name in the code cell with @value,
+        without changing the source code. Any object may be used as @value.
+        """
+        self.substitutions[name] = value
+        try:
+            _, found = _compile_cell(self.source, tuple(sorted(self.substitutions)))
+        except SyntaxError:
+            found = ()
+        if name in found:
+            self._modified(f"Making adjustment to code: {name} = {value!r}")
+        else:
+            del self.substitutions[name]
+            self.log.append(f"Could not adjust code: no assignment to '{name}' found.")
@@ -1,5 +1,6 @@
-from . import compare_type, compare_values, print2str, args2str, VariableTests, compare_printout
+from . import compare_type, compare_values, compare_signals, print2str, args2str, VariableTests, compare_printout, fit_exponent, measure_scaling
 from unittest.mock import patch
+import numpy as np
 
 
 class FunctionTests(VariableTests):
@@ -124,4 +125,62 @@ class FunctionTests(VariableTests):
             else:
                 # Alert no match in types
                 self.add_result(False, "test call %s(%s) returned a value of type %s and not %s."%
-                                (self.test_func.__name__, arg_str, type(x).__name__, type(y).__name__))
\ No newline at end of file
+                                (self.test_func.__name__, arg_str, type(x).__name__, type(y).__name__))
+
+    def test_return_signal(self, *args, max_lag=None, fit_gain=False, **kwargs):
+        """
+        Method to compare the signal returned by the student function with the
+        signal returned by the reference function for the same arguments, accepting
+        a delay of up to @max_lag samples, a different length and, with @fit_gain, a
+        constant scale factor. The detected lag is reported in the feedback.
+        """
+        arg_str = args2str(*args, **kwargs)
+        try:
+            with patch('__main__.print'):
+                x = self.test_func(*args, **kwargs)
+        except Exception as e:
+            msg_body = "test call "+str(self.test_func.__name__)+"("+arg_str+") exited with errors: " + str(e.args[0])
+            self.add_result(False, msg_body, wgt=self.usage_wgt)
+            return
+        with patch('__main__.print'):
+            y = self.ref_func(*args, **kwargs)
+
+        test_result, val_msg = compare_signals(x, y, rtol=self.rtol, atol=self.atol, max_lag=max_lag, fit_gain=fit_gain)
+        func_msg = "%scorrect return value for function call '%s(%s)': <div style='margin-left: 15px;'>%s</div>"%(
+            "" if test_result else "in", self.test_func.__name__, arg_str, val_msg)
+        self.add_result(test_result, func_msg)
+
+    def test_complexity(self, make_input: callable, min_size=64, max_size=65536, num_sizes=8,
+                        time_budget=5.0, tol=0.5, wgt=1.0):
+        """
+        Method to compare empirical runtime scaling of the student function with the
+        reference function. Both functions are timed over a geometric series of input
+        sizes, generated by 'make_input(n)', and the exponent k in 't = c*n^k' is
+        estimated with log-log regression. The test passes if the student's exponent
+        exceeds the reference exponent by no more than 'tol'.
+        Timing stops early when 'time_budget' seconds are spent.
+        """
+        sizes = np.unique(np.geomspace(min_size, max_size, num_sizes).astype(int))
+        try:
+            with patch('__main__.print'):
+                measured, (ref_times, test_times) = measure_scaling(
+                    (self.ref_func, self.test_func), make_input, sizes, time_budget=time_budget)
+        except Exception as e:
+            msg_body = "runtime measurement of "+str(self.test_func.__name__)+" exited with errors: " + str(e.args[0])
+            self.add_result(False, msg_body, wgt=wgt)
+            return
+
+        if len(measured) < 3:
+            self.add_result(False,
+                            "runtime measurement of %s exceeded the time budget of %s s after %d input size(s)."%
+                            (self.test_func.__name__, time_budget, len(measured)),
+                            wgt=wgt)
+            return
+
+        k_test = fit_exponent(measured, test_times)
+        k_ref = fit_exponent(measured, ref_times)
+        test_result = k_test <= k_ref + tol
+        self.add_result(test_result,
+                        "runtime of %s grows approximately as O(n^%.2f) for input sizes %d to %d, reference solution grows as O(n^%.2f)."%
+                        (self.test_func.__name__, k_test, measured[0], measured[-1], k_ref),
+                        wgt=wgt)
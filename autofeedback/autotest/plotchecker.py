@@ -1,20 +1,274 @@
-from . import TestClass, compare_type, compare_values
+from collections import namedtuple
+from io import BytesIO
+import numpy as np
+from . import TestClass, compare_arrays, sample_indices
+
+# Data of a plotted artist: kind is one of "line", "scatter", "stem" or "image",
+# axes is the index of the axes in the figure, and y holds the image array for images
+PlotData = namedtuple("PlotData", ["kind", "axes", "label", "x", "y"])
+
+# Resolution at which figures are rendered for perceptual hashing, the attribute of
+# checked figures holding the reference hash of the plot task, and the MIME type used
+# to report hashes of reference figures at release time
+hash_dpi = 30
+reference_hash_attr = "autofeedback_reference_hash"
+plot_hash_mime = "application/vnd.autofeedback.plothash+json"
+
+
+def _as_array(values):
+    """
+    Function to convert plotted data to a float array, with masked values as NaN.
+    Data that is not numerical (e.g. categories or dates) is returned unchanged.
+    """
+    try:
+        return np.ma.filled(np.ma.asarray(values, dtype=float), np.nan)
+    except (TypeError, ValueError):
+        return np.asarray(values)
+
+
+def collect_plot_data(fig):
+    """
+    Function to collect the data of all lines, scatter plots, stem plots and images
+    in all axes of figure 'fig' in a single traversal, in the order the artists
+    were added. Returns a list of PlotData.
+    """
+    from matplotlib.lines import Line2D
+    from matplotlib.collections import PathCollection
+    from matplotlib.image import AxesImage
+    from matplotlib.container import StemContainer
+
+    data = []
+    for axes_index, ax in enumerate(fig.axes):
+        # Stem plots consist of a marker line, stem lines and a base line, of which
+        # only the marker line is recorded
+        stems, skip = {}, set()
+        for container in ax.containers:
+            if isinstance(container, StemContainer):
+                stems[id(container.markerline)] = container
+                skip.update((id(container.stemlines), id(container.baseline)))
+        for artist in ax.get_children():
+            if id(artist) in skip:
+                continue
+            if id(artist) in stems:
+                data.append(PlotData("stem", axes_index, stems[id(artist)].get_label(),
+                                     _as_array(artist.get_xdata()), _as_array(artist.get_ydata())))
+            elif isinstance(artist, Line2D):
+                data.append(PlotData("line", axes_index, artist.get_label(),
+                                     _as_array(artist.get_xdata()), _as_array(artist.get_ydata())))
+            elif isinstance(artist, PathCollection):
+                offsets = _as_array(artist.get_offsets())
+                data.append(PlotData("scatter", axes_index, artist.get_label(), offsets[:, 0], offsets[:, 1]))
+            elif isinstance(artist, AxesImage):
+                data.append(PlotData("image", axes_index, artist.get_label(), None, _as_array(artist.get_array())))
+    return data
+
+
+def _dct_matrix(n: int):
+    k = np.arange(n)
+    dct = np.cos(np.pi*(2*k[None, :] + 1)*k[:, None]/(2*n))
+    dct[0] /= np.sqrt(2)
+    return dct*np.sqrt(2/n)
+
+
+def figure_hash(fig, dpi=hash_dpi, hash_size=8):
+    """
+    Function to compute a perceptual hash of figure 'fig', rendered with Agg at
+    'dpi'. The rendered image is reduced to 4*'hash_size' square gray values, of
+    which the lowest 'hash_size'**2 frequencies of the discrete cosine transform
+    are compared with their median. Returns the hash as a hexadecimal string.
+    Similar looking figures have hashes differing in few bits (see 'hash_distance').
+    """
+    from matplotlib.image import imread
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi)
+    buffer.seek(0)
+    image = imread(buffer, format="png")
+    gray = image[..., :3] @ np.array([0.299, 0.587, 0.114])
+    # Reduce image to n x n block averages
+    n = 4*hash_size
+    for axis in (0, 1):
+        edges = np.linspace(0, gray.shape[axis], n + 1).astype(int)
+        counts = np.maximum(np.diff(edges), 1)
+        gray = np.add.reduceat(gray, edges[:-1], axis=axis)/np.expand_dims(counts, 1 - axis)
+    dct = _dct_matrix(n)
+    low = (dct @ gray @ dct.T)[:hash_size, :hash_size].ravel()
+    bits = low > np.median(low[1:])
+    return np.packbits(bits).tobytes().hex()
+
+
+def hash_distance(hash1: str, hash2: str):
+    """
+    Function to return the number of differing bits of two figure hashes.
+    """
+    return bin(int(hash1, 16) ^ int(hash2, 16)).count("1")
+
+
+def display_figure_hash(fig):
+    """
+    Function to display the hash of figure 'fig' as output for HashReferencePlots.
+    """
+    from IPython.display import display
+    if fig is not None:
+        display({plot_hash_mime: {"hash": figure_hash(fig)}}, raw=True)
 
 
 class PlotChecker(TestClass):
-    def __init__(self, fig):
-        self.fig = fig
-        self.ca = self.fig.axes[-1]
+    """
+    Test class to check the figure 'fig' created by a plotting task. The data of
+    all lines, scatter plots, stem plots and images in the figure is collected once,
+    and compared with reference data as arrays. Reference functions are first
+    evaluated at 'max_points' evenly spaced points of long lines, and only at full
+    resolution if these are correct. The figure is closed when 'get_results' is
+    called, so it can be released by matplotlib.
+
+    Example usage:
+    ----------------------------------
+    test_obj = PlotChecker(fig)
+    test_obj.test_function(np.sin)
+    test_obj.test_y(y_ref, kind="scatter")
+    test_obj.get_results()*cell_points
+    ----------------------------------
+
+    Plots that are hard to check artist by artist can be compared with the
+    reference solution as rendered images with 'test_hash'. The reference hash is
+    stored in the metadata of the plot task cell by HashReferencePlots at release.
+    """
+
+    def __init__(self, fig, rtol=1e-2, atol=1e-8, max_points=10000):
         super().__init__()
+        self.fig = fig
+        self.rtol = rtol
+        self.atol = atol
+        self.max_points = max_points
+        self.ca = None
+        self.data = []
+        self._hash = None
+        if fig is None or len(fig.axes) == 0:
+            self.add_result(False, "no plot found.")
+        else:
+            self.ca = self.fig.axes[-1]
+            self.data = collect_plot_data(fig)
+
+    def close(self):
+        """
+        Closes the checked figure and drops the references to it.
+        """
+        if self.fig is not None:
+            from matplotlib.pyplot import close
+            close(self.fig)
+        self.fig = None
+        self.ca = None
+
+    def get_results(self):
+        self.close()
+        return super().get_results()
+
+    def get_data(self, kind=None, axes_index=None):
+        """
+        Returns the data of plotted artists of type @kind (default: all but images)
+        in the axes with index @axes_index (default: all axes).
+        """
+        if axes_index is not None and axes_index < 0:
+            axes_index += len(self.fig.axes) if self.fig is not None else 0
+        return [data for data in self.data
+                if (data.kind == kind if kind is not None else data.kind != "image")
+                and (axes_index is None or data.axes == axes_index)]
+
+    def _select(self, kind, index, axes_index):
+        # Returns the selected artist, or None after recording a failed test
+        candidates = self.get_data(kind, axes_index)
+        try:
+            return candidates[index]
+        except IndexError:
+            if self.ca is not None:
+                self.add_result(False, f"plot does not contain {kind or 'line'} number {index} in the selected axes.")
+            return None
+
+    def _describe(self, data):
+        label = "" if data.label.startswith("_") else f" '{data.label}'"
+        return f"{data.kind}{label}"
+
+    def test_function(self, func: callable, line_index=-1, axes_index=-1, kind="line", wgt=1.0):
+        """
+        Checks that the plotted values of a line (or scatter/stem plot with @kind)
+        match reference function @func, evaluated at the plotted x values. Line
+        @line_index counts only artists of type @kind.
+        """
+        data = self._select(kind, line_index, axes_index)
+        if data is None:
+            return
+        x, y = data.x, data.y
+        idx = sample_indices(len(x), self.max_points)
+        passed, msg = compare_arrays(y[idx], func(x[idx]), rtol=self.rtol, atol=self.atol)
+        if passed and not isinstance(idx, slice):
+            passed, msg = compare_arrays(y, func(x), rtol=self.rtol, atol=self.atol, max_points=self.max_points)
+        self.add_result(passed, f"{self._describe(data)} in plot: {msg}", wgt)
+
+    def _test_values(self, coord: str, values, kind, axes_index, wgt):
+        # Passes if any plotted artist has the reference values as its x or y data
+        values = np.asarray(values)
+        closest = None
+        for data in self.get_data(kind, axes_index):
+            plotted = data.x if coord == "x" else data.y
+            if plotted is None or np.shape(plotted) != values.shape:
+                continue
+            passed, msg = compare_arrays(plotted, values, rtol=self.rtol, atol=self.atol, max_points=self.max_points)
+            if passed:
+                self.add_result(True, f"{self._describe(data)} in plot has the correct {coord} values.", wgt)
+                return
+            if closest is None:
+                closest = f"{self._describe(data)} in plot: {msg}"
+        if closest is not None:
+            self.add_result(False, f"no plotted data has the expected {coord} values; {closest}", wgt)
+        else:
+            self.add_result(False, f"no plotted data has {coord} values of length {len(values)}.", wgt)
+
+    def test_x(self, x_vals, kind=None, axes_index=None, wgt=1.0):
+        """
+        Checks that an artist in the plot has x values @x_vals.
+        """
+        self._test_values("x", x_vals, kind, axes_index, wgt)
+
+    def test_y(self, y_vals, kind=None, axes_index=None, wgt=1.0):
+        """
+        Checks that an artist in the plot has y values @y_vals.
+        """
+        self._test_values("y", y_vals, kind, axes_index, wgt)
+
+    def test_image(self, image, index=-1, axes_index=-1, wgt=1.0):
+        """
+        Checks that the displayed image array matches @image.
+        """
+        data = self._select("image", index, axes_index)
+        if data is None:
+            return
+        passed, msg = compare_arrays(data.y, image, rtol=self.rtol, atol=self.atol, max_points=self.max_points)
+        self.add_result(passed, f"image in plot: {msg}", wgt)
+
+    def get_hash(self):
+        """
+        Returns the perceptual hash of the checked figure, rendered only once.
+        """
+        if self._hash is None and self.fig is not None:
+            self._hash = figure_hash(self.fig)
+        return self._hash
 
-    def test_function(self, func: callable, line_index=-1):
-
-        line = self.ca.lines[line_index]
-        result, msg = compare_values(line.get_ydata(), func(line.get_xdata()))
-        self.add_result(result, msg)
-        
-    def test_x(self, x_vals):
-        pass
-        
-    def test_y(self, y_vals):
-        pass
\ No newline at end of file
+    def test_hash(self, reference: str = None, max_distance=10, wgt=1.0):
+        """
+        Checks that the rendered figure looks like the reference figure, by comparing
+        their perceptual hashes (64 bits). At most @max_distance bits may differ.
+        Without @reference, the hash stored for the plot task at release is used.
+        """
+        if self.fig is None:
+            return
+        if reference is None:
+            reference = getattr(self.fig, reference_hash_attr, None)
+        if reference is None:
+            self.add_result(False, "no reference plot available to compare the rendered plot with.", wgt)
+            return
+        distance = hash_distance(self.get_hash(), reference)
+        if distance <= max_distance:
+            self.add_result(True, f"rendered plot looks like the reference plot ({distance} of 64 hash bits differ).", wgt)
+        else:
+            self.add_result(False, f"rendered plot looks different from the reference plot ({distance} of 64 hash bits "
+                                   f"differ, at most {max_distance} allowed).", wgt)
@@ -1,40 +1,130 @@
+import re
+import json
+from array import array
+from collections import namedtuple
+from html import unescape
 from string import Template
+from time import perf_counter
 from IPython.display import HTML, display
 
+# MIME type of the machine-readable test results displayed alongside the HTML feedback
+results_mime = "application/vnd.autofeedback.results+json"
+
+
+# Log entry for FeedbackLogger. Plain messages have 'number' and 'passed' set to None.
+# 'msg' is a string, or a callable returning the message string when the log is rendered.
+# 'elapsed' is the time in seconds spent on the test.
+LogRecord = namedtuple("LogRecord", ["number", "passed", "wgt", "msg", "elapsed"], defaults=(0.0,))
+
 
 class FeedbackLogger:
     """
     Class to log feedback messages from test results,
     and present end result using HTML formatting.
+    Messages are kept as structured records, and are rendered to
+    HTML, plain text or JSON only when the log is displayed.
     """
 
-    def __init__(self, init_log=[]):
+    def __init__(self, init_log=[], fmt="html"):
         """
         Creates a new instance of FeedbackLogger with the option
-        to pass initial message lines to @log.
+        to pass initial message lines to @log, and choose the default
+        output format @fmt ("html", "text" or "json").
         """
-        self.message_log = [] + init_log
+        self.records = [LogRecord(None, None, 0.0, msg) for msg in init_log]
+        self.fmt = fmt
         self.log_template = Template('<div class = "alert alert-$level">$msg</div>')
 
-    def append(self, msg: str):
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def message_log(self):
+        """
+        List of log messages rendered as HTML strings.
+        """
+        return [self._render_record(record) for record in self.records]
+
+    def append(self, msg):
         """
         Adds feedback message @msg to end of log
         """
-        self.message_log.append(msg)
+        self.records.append(LogRecord(None, None, 0.0, msg))
 
-    def insert(self, index: int, msg: str):
+    def insert(self, index: int, msg):
         """
         Inserts feedback message @msg with index @index
         """
-        self.message_log.insert(index, msg)
+        self.records.insert(index, LogRecord(None, None, 0.0, msg))
+
+    def log_result(self, number: int, passed: bool, wgt: float, msg, elapsed: float = 0.0):
+        """
+        Adds the result of test number @number to end of log. Message @msg
+        may be a callable, in which case it is evaluated at display time.
+        """
+        self.records.append(LogRecord(number, bool(passed), wgt, msg, elapsed))
+
+    @staticmethod
+    def _render_record(record: LogRecord):
+        msg = record.msg() if callable(record.msg) else record.msg
+        if record.number is None:
+            return msg
+        return f"Test {record.number} {'passed' if record.passed else 'failed'}: {msg}"
+
+    @staticmethod
+    def _html2text(msg: str):
+        msg = re.sub(r"<br\s*/?>|<div[^>]*>", "\n", msg)
+        return unescape(re.sub(r"<[^>]+>", "", msg)).strip()
+
+    def to_records(self, max_length: int = None):
+        """
+        Returns test results in log as a list of dictionaries with plain text messages,
+        optionally shortened to @max_length characters.
+        """
+        records = []
+        for record in self.records:
+            if record.number is None:
+                continue
+            msg = self._html2text(record.msg() if callable(record.msg) else record.msg)
+            if max_length is not None and len(msg) > max_length:
+                msg = msg[:max_length-3] + "..."
+            records.append({"id": record.number,
+                            "passed": record.passed,
+                            "weight": record.wgt,
+                            "elapsed": record.elapsed,
+                            "message": msg})
+        return records
+
+    def render(self, level: str, fmt: str = None):
+        """
+        Renders log as a string using format @fmt ("html", "text" or "json").
+        @level controls the color alert scheme of HTML output.
+        """
+        fmt = self.fmt if fmt is None else fmt
+        if fmt == "html":
+            output = "<br>".join(self._render_record(record) for record in self.records)
+            return self.log_template.substitute({"level":level,"msg":output})
+        elif fmt == "text":
+            return "\n".join(self._html2text(self._render_record(record)) for record in self.records)
+        elif fmt == "json":
+            return json.dumps({"level": level, "records": self.to_records()})
+        else:
+            raise ValueError(f"unknown log format '{fmt}'")
 
-    def display(self, level: str):
+    def display(self, level: str, fmt: str = None, data: dict = None):
         """ 
         Displays message using HTML formatting and color alert scheme controlled by 
-        @level.
-        """
-        output = "<br>".join(self.message_log)
-        display(HTML(self.log_template.substitute({"level":level,"msg":output})))
+        @level. Optional @fmt overrides the output format of the logger.
+        Optional @data maps additional MIME types to content displayed in the same
+        output as the HTML message.
+        """
+        fmt = self.fmt if fmt is None else fmt
+        if fmt == "html" and data:
+            display({"text/html": self.render(level, fmt), **data}, raw=True)
+        elif fmt == "html":
+            display(HTML(self.render(level, fmt)))
+        else:
+            print(self.render(level, fmt))
 
     def clear(self, start: int = 0, stop: int = -1, step: int = 1):
         """
@@ -42,13 +132,10 @@ class FeedbackLogger:
         No input arguments clears the entire list.
         """
         if stop < -0:
-            stop = len(self.message_log) + 1 + stop
+            stop = len(self.records) + 1 + stop
         if start < -0:
-            start = len(self.message_log) + start
-        index = list(range(start, stop, step))
-        index.reverse()
-        for i in index:
-            self.message_log.pop(i)
+            start = len(self.records) + start
+        del self.records[start:stop:step]
 
 
 class ScoreCalculator:
@@ -56,11 +143,18 @@ class ScoreCalculator:
     Class to keep track of test score.
     Test results are accumulated over time, and finally returned as a value between 
     0.0 and 1.0.
+    Results and weights are stored in compact arrays, with running sums kept up to
+    date so that score queries do not depend on the number of tests.
     """
 
+    __slots__ = ("test_results", "weights", "_passed", "_wgt_sum", "_wgt_passed")
+
     def __init__(self):
-        self.test_results = []
-        self.weights = []
+        self.test_results = array("b")
+        self.weights = array("d")
+        self._passed = 0
+        self._wgt_sum = 0.0
+        self._wgt_passed = 0.0
 
     def process_result(self, result: bool, wgt: float = 1.0):
         """
@@ -68,25 +162,27 @@ class ScoreCalculator:
         @wgt weight is relative, with default of 1.0 attributing equal amount
         of points per test.
         """
+        result = bool(result)
         self.weights.append(wgt)
         self.test_results.append(result)
+        self._wgt_sum += wgt
+        if result:
+            self._passed += 1
+            self._wgt_passed += wgt
 
     def get_ratio(self):
         """
         Returns ratio of tests passed to total number of tests.
         """
-        return sum(self.test_results), len(self.test_results)
+        return self._passed, len(self.test_results)
 
     def get_score(self):
         """
         Returns final score as a number 0.0 <= score <= 1.0.
         """
-        score = 0.0
-        wgt_sum = sum(self.weights)
-        # Distribute remaining score difference evenly among remaining tests
-        # Calculate score
-        for i in range(len(self.weights)):
-            score += self.weights[i]*self.test_results[i]/wgt_sum
+        if self._wgt_sum == 0.0:
+            return 0.0
+        score = self._wgt_passed/self._wgt_sum
         # Constrain score to number between 0.0 and 1.0
         score = max(score, 0.0)
         score = min(score, 1.0)
@@ -96,8 +192,12 @@ class ScoreCalculator:
         """
         Remove test results at index 'n' from calculated score.
         """
-        self.test_results.pop(n)
-        self.weights.pop(n)
+        result = self.test_results.pop(n)
+        wgt = self.weights.pop(n)
+        self._wgt_sum -= wgt
+        if result:
+            self._passed -= 1
+            self._wgt_passed -= wgt
 
 class TestClass:
     """
@@ -118,18 +218,19 @@ class TestClass:
     def __init__(self):
         self.log = FeedbackLogger()
         self.score = ScoreCalculator()
+        self._last_result_time = perf_counter()
 
-    def add_result(self, result: bool, msg: str, wgt=1.0):
+    def add_result(self, result: bool, msg, wgt=1.0):
         _, N_tests = self.score.get_ratio()
-        msg_intro = f"Test {N_tests + 1}"
+        now = perf_counter()
         self.score.process_result(result, wgt)
-        if result:
-            self.log.append(msg_intro + " passed: " + msg)
-        else:
-            self.log.append(msg_intro + " failed: " + msg)
+        self.log.log_result(N_tests + 1, result, wgt, msg, now - self._last_result_time)
+        self._last_result_time = now
 
     def get_results(self):
         score = self.score.get_score()
+        # Machine-readable results are collected before the log is trimmed for display
+        results = {"score": score, "tests": self.log.to_records(max_length=200)}
         if round(score, 3) >= 1.0:
             self.log.clear()
             self.log.append("All tests passed. ")
@@ -143,5 +244,5 @@ class TestClass:
             passed, total = self.score.get_ratio()
             self.log.insert(0, f"{passed} of {total} tests passed:")
             level = "warning"
-        self.log.display(level)
+        self.log.display(level, data={results_mime: results})
         return score
\ No newline at end of file
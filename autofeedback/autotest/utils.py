@@ -1,5 +1,6 @@
 import re
 from io import StringIO
+from time import perf_counter
 import numpy as np
 
 
@@ -63,6 +64,263 @@ def get_deviation(x, y, rtol=1e-2, atol=1e-8):
     return np.max(err), np.max(rel_err)
 
 
+def sample_indices(n: int, max_points: int):
+    """
+    Function to return 'max_points' evenly spaced indices into a sequence of length 'n',
+    including the first and last element. Returns slice(None) (all elements) if 'n'
+    does not exceed 'max_points'.
+    """
+    if n <= max_points:
+        return slice(None)
+    return np.unique(np.linspace(0, n - 1, max_points).round().astype(np.intp))
+
+
+def compare_arrays(x, y, rtol=1e-2, atol=1e-8, max_points=10000):
+    """
+    Function to compare numerical arrays 'x' and 'y' elementwise, and return both a
+    test result and a message. Arrays with more than 'max_points' elements are first
+    compared at 'max_points' evenly spaced elements, so incorrect arrays are usually
+    rejected after little work, and are then checked at full resolution in a single
+    vectorized pass, so that isolated incorrect values are not missed.
+    """
+    try:
+        x, y = np.asarray(x), np.asarray(y)
+        if x.shape != y.shape:
+            return False, f"array has shape {x.shape} and not {y.shape}."
+        x, y = x.reshape(-1), y.reshape(-1)
+        stages = [(x, y)]
+        if x.size > max_points:
+            idx = sample_indices(x.size, max_points)
+            stages.insert(0, (x[idx], y[idx]))
+        for xs, ys in stages:
+            err = np.abs(xs - ys)
+            bound = atol + rtol*np.abs(ys)
+            incorrect = ~(err <= bound)
+            if incorrect.any():
+                err, bound = err[incorrect], np.abs(ys[incorrect])
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    rel_err = err/bound
+                return False, (f"array contains one or more incorrect values; max absolute error = {np.max(err)}, "
+                               f"max relative error = {np.max(rel_err):.3f}.")
+    except Exception as e:
+        return False, "array verification failed: " + str(e)
+    return True, "array values are correct within tolerance."
+
+
+def estimate_lag(x, y, max_lag=None, min_overlap=0.5, fit_gain=False):
+    """
+    Function to estimate the lag of signal 'x' relative to reference signal 'y',
+    i.e. x[n] ~ y[n - lag], from the peak of their normalized cross-correlation.
+    The cross-correlation is computed with FFTs, and the signal energies of the
+    overlaps with cumulative sums, in O(n log n) in total. Only lags of at most
+    'max_lag' samples (if given), for which the signals overlap in at least the
+    fraction 'min_overlap' of the shorter signal, are considered. With 'fit_gain',
+    the peak of the correlation magnitude is used, so that a negative gain is found
+    too. Returns (lag, gain), where 'gain' is the least squares scale factor of 'y'
+    on the overlap.
+    """
+    x, y = np.asarray(x).reshape(-1), np.asarray(y).reshape(-1)
+    n = len(x) + len(y) - 1
+    nfft = 1 << (n - 1).bit_length()
+    if np.iscomplexobj(x) or np.iscomplexobj(y):
+        corr = np.fft.ifft(np.fft.fft(x, nfft)*np.conj(np.fft.fft(y, nfft))).real
+    else:
+        corr = np.fft.irfft(np.fft.rfft(x, nfft)*np.conj(np.fft.rfft(y, nfft)), nfft)
+    # Circular correlation holds lags 0..len(x)-1 first, negative lags at the end
+    lags = np.concatenate((np.arange(len(x)), np.arange(-(len(y) - 1), 0)))
+    corr = np.concatenate((corr[:len(x)], corr[nfft - (len(y) - 1):]))
+
+    # Overlap length and signal energies on the overlap for every lag
+    start_x, start_y = np.maximum(lags, 0), np.maximum(-lags, 0)
+    length = np.minimum(len(x) - start_x, len(y) - start_y)
+    energy_x = np.concatenate(([0.0], np.cumsum(np.abs(x)**2)))
+    energy_y = np.concatenate(([0.0], np.cumsum(np.abs(y)**2)))
+    energy = ((energy_x[start_x + length] - energy_x[start_x])*
+              (energy_y[start_y + length] - energy_y[start_y]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = np.where(energy > 0, corr/np.sqrt(energy), 0.0)
+
+    valid = length >= min_overlap*min(len(x), len(y))
+    if max_lag is not None:
+        valid &= np.abs(lags) <= max_lag
+    valid[0] = True # Lag 0 is always a candidate
+    lag = int(lags[valid][np.argmax(np.abs(corr[valid]) if fit_gain else corr[valid])])
+    xo, yo = _overlap(x, y, lag)
+    power = np.vdot(yo, yo).real
+    gain = np.vdot(yo, xo)/power if power > 0 else 1.0
+    return lag, gain.real if np.isrealobj(x) and np.isrealobj(y) else gain
+
+
+def _overlap(x, y, lag):
+    # Returns the overlapping parts of x and y aligned for x[n] ~ y[n - lag]
+    if lag >= 0:
+        m = min(len(x) - lag, len(y))
+        return x[lag:lag + m], y[:m]
+    m = min(len(x), len(y) + lag)
+    return x[:m], y[-lag:-lag + m]
+
+
+def compare_signals(x, y, rtol=1e-2, atol=1e-8, max_lag=None, fit_gain=False, min_overlap=0.5):
+    """
+    Function to compare signal 'x' with reference signal 'y', allowing for a delay
+    and a different length, e.g. from another convolution mode. The lag is estimated
+    with 'estimate_lag', and the overlapping samples are compared within tolerance.
+    With 'fit_gain', a constant scale factor is allowed as well. The overlap must
+    cover at least the fraction 'min_overlap' of the reference signal. Returns both
+    a test result and a message reporting the detected lag.
+    """
+    try:
+        x, y = np.asarray(x).reshape(-1), np.asarray(y).reshape(-1)
+        if len(x) == 0 or len(y) == 0:
+            return False, f"signal has length {len(x)}, expected a signal of length {len(y)}."
+        lag, gain = estimate_lag(x, y, max_lag, min_overlap, fit_gain)
+        xo, yo = _overlap(x, y, lag)
+        if len(yo) < min_overlap*len(y):
+            return False, (f"signal overlaps the expected signal in only {len(yo)} of {len(y)} samples "
+                           f"at the best lag of {lag} samples.")
+        passed, msg = compare_arrays(xo, gain*yo if fit_gain else yo, rtol=rtol, atol=atol)
+    except Exception as e:
+        return False, "signal verification failed: " + str(e)
+    alignment = f"a lag of {lag} samples" + (f" and a gain of {gain:.3g}" if fit_gain else "")
+    if passed:
+        return True, f"signal matches the expected signal within tolerance, with {alignment} ({len(yo)} samples compared)."
+    return False, f"signal does not match the expected signal at the best alignment, with {alignment}: {msg}"
+
+
+def _is_pandas(value):
+    # Duck-typed check for pandas objects, so that pandas is not required
+    return type(value).__module__.split(".")[0] == "pandas" and hasattr(value, "to_numpy")
+
+
+def _is_numeric_array(value):
+    return isinstance(value, np.ndarray) and (np.issubdtype(value.dtype, np.number) or value.dtype == bool)
+
+
+def _is_nested(value):
+    return isinstance(value, (tuple, list)) and any(isinstance(v, (dict, tuple, list, np.ndarray)) or _is_pandas(v)
+                                                    for v in value)
+
+
+def _first_incorrect(x, y, rtol, atol):
+    # Compares numerical arrays of equal shape with one vectorized call, and returns the
+    # index of the first incorrect element (or None) and the number of incorrect elements
+    if y.dtype == bool or x.dtype == bool:
+        incorrect = x != y
+    else:
+        incorrect = ~np.isclose(x, y, rtol=rtol, atol=atol, equal_nan=True)
+    if not incorrect.any():
+        return None, 0
+    return np.unravel_index(np.argmax(incorrect), incorrect.shape), int(np.count_nonzero(incorrect))
+
+
+def _incorrect_msg(path, x, y, count):
+    return f"{path} is {x}, expected {y}" + (f" ({count - 1} more incorrect values)." if count > 1 else ".")
+
+
+def _compare_leaf_arrays(x, y, path, rtol, atol):
+    if x.shape != y.shape:
+        return False, f"{path} has shape {x.shape} and not {y.shape}."
+    first, count = _first_incorrect(x, y, rtol, atol)
+    if first is None:
+        return True, ""
+    index = "[" + ", ".join(str(i) for i in first) + "]"
+    return False, _incorrect_msg(path + index, x[first], y[first], count)
+
+
+def _compare_frames(x, y, path, rtol, atol):
+    # Compares pandas DataFrames or Series column by column, without conversion to Python objects
+    if hasattr(y, "columns") != hasattr(x, "columns"):
+        return False, f"{path} is a {type(x).__name__} and not a {type(y).__name__}."
+    if not x.index.equals(y.index):
+        if len(x.index) != len(y.index):
+            return False, f"{path} has {len(x.index)} rows and not {len(y.index)}."
+        return False, f"{path} does not have the expected row labels."
+    if hasattr(y, "columns"):
+        missing = [col for col in y.columns if col not in x.columns]
+        if len(missing) > 0:
+            return False, f"{path} is missing column {missing[0]!r}."
+        columns = [(x[col], y[col], f"{path}[{col!r}]") for col in y.columns]
+    else:
+        columns = [(x, y, path)]
+    for x_col, y_col, col_path in columns:
+        x_values, y_values = x_col.to_numpy(), y_col.to_numpy()
+        if _is_numeric_array(y_values) and _is_numeric_array(x_values):
+            first, count = _first_incorrect(x_values, y_values, rtol, atol)
+            if first is not None:
+                return False, _incorrect_msg(f"{col_path}[{y.index[first[0]]!r}]",
+                                             x_values[first], y_values[first], count)
+        elif not x_col.equals(y_col):
+            differs = np.flatnonzero(np.asarray(x_values != y_values))
+            if len(differs) == 0:
+                return False, f"{col_path} does not contain the expected values."
+            return False, _incorrect_msg(f"{col_path}[{y.index[differs[0]]!r}]",
+                                         repr(x_values[differs[0]]), repr(y_values[differs[0]]), len(differs))
+    return True, ""
+
+
+def compare_nested(x, y, rtol=1e-2, atol=1e-8, path="value"):
+    """
+    Function to recursively compare nested dicts, lists and tuples, numpy arrays
+    and pandas DataFrames/Series, and return both a test result and a message.
+    Numerical arrays and lists of numbers are compared with one vectorized call,
+    DataFrames column by column. The comparison stops at the first difference, and
+    the message reports the path to the first incorrect element, e.g. "value['a'][2]".
+    """
+    passed, msg = _compare_nested(x, y, rtol, atol, path)
+    return passed, msg if not passed else f"{path} is correct within tolerance."
+
+
+def _compare_nested(x, y, rtol, atol, path):
+    x = x[()] if isinstance(x, np.ndarray) and x.ndim == 0 else x
+    y = y[()] if isinstance(y, np.ndarray) and y.ndim == 0 else y
+    if _is_pandas(y):
+        if not _is_pandas(x):
+            return False, f"{path} is type {type(x).__name__} and not {type(y).__name__}."
+        return _compare_frames(x, y, path, rtol, atol)
+    if isinstance(y, dict):
+        if not isinstance(x, dict):
+            return False, f"{path} is type {type(x).__name__} and not dict."
+        missing = [key for key in y if key not in x]
+        if len(missing) > 0:
+            return False, f"{path} is missing key {missing[0]!r}."
+        unexpected = [key for key in x if key not in y]
+        if len(unexpected) > 0:
+            return False, f"{path} has unexpected key {unexpected[0]!r}."
+        for key in y:
+            passed, msg = _compare_nested(x[key], y[key], rtol, atol, f"{path}[{key!r}]")
+            if not passed:
+                return False, msg
+        return True, ""
+    if isinstance(y, (tuple, list, np.ndarray)):
+        if not isinstance(x, (tuple, list, np.ndarray)):
+            return False, f"{path} is type {type(x).__name__} and not {type(y).__name__}."
+        if len(x) != len(y):
+            return False, f"{path} has length {len(x)} and not {len(y)}."
+        if not (_is_nested(y) or _is_nested(x)):
+            try:
+                x_values, y_values = np.asarray(x), np.asarray(y)
+            except ValueError:
+                x_values = y_values = None
+            if _is_numeric_array(x_values) and _is_numeric_array(y_values):
+                return _compare_leaf_arrays(x_values, y_values, path, rtol, atol)
+        for i, (x_item, y_item) in enumerate(zip(x, y)):
+            passed, msg = _compare_nested(x_item, y_item, rtol, atol, f"{path}[{i}]")
+            if not passed:
+                return False, msg
+        return True, ""
+    if isinstance(y, (bool, np.bool_)) or not isinstance(y, (int, float, complex, np.number)):
+        try:
+            passed = bool(x == y)
+        except Exception:
+            passed = False
+        return passed, "" if passed else f"{path} is {x!r}, expected {y!r}."
+    if not isinstance(x, (int, float, complex, np.number)) or isinstance(x, (bool, np.bool_)):
+        return False, f"{path} is type {type(x).__name__} and not {type(y).__name__}."
+    if np.isclose(x, y, rtol=rtol, atol=atol, equal_nan=True):
+        return True, ""
+    return False, f"{path} is {x}, expected {y}."
+
+
 def compare_values(x, y, rtol=1e-2, atol=1e-8):
     """
     Function to compare two variables, and return both a test result and a message.
@@ -91,6 +349,11 @@ def compare_values(x, y, rtol=1e-2, atol=1e-8):
                 err, rel_err = get_deviation(x, y, rtol=rtol, atol=atol)
                 msg = f"value {x} is incorrect... absolute error = {err}, relative error = {rel_err}."
 
+    elif isinstance(y, dict) or _is_pandas(y) or _is_nested(y):
+        passed, msg = compare_nested(x, y, rtol=rtol, atol=atol)
+        if not passed:
+            msg = "value is incorrect: " + msg
+
     elif isinstance(y, (tuple, list, np.ndarray)):
         if len(x) != len(y):
             msg = f"array has length {len(x)} and not {len(y)}."
@@ -150,4 +413,54 @@ def compare_printout(x, y):
     if len(missing) > 0:
         passed = False
         x_msg = x_msg + "<br>List of missing keywords: " + str(missing)
-    return passed, x_msg
\ No newline at end of file
+    return passed, x_msg
+
+
+def fit_exponent(sizes, times):
+    """
+    Function to estimate the scaling exponent 'k' in 't = c*n^k' by least
+    squares regression of log(times) against log(sizes).
+    """
+    log_n = np.log(np.asarray(sizes, dtype=float))
+    log_t = np.log(np.maximum(np.asarray(times, dtype=float), 1e-9))
+    k, _ = np.polyfit(log_n, log_t, 1)
+    return k
+
+
+def measure_scaling(funcs, make_input, sizes, time_budget=5.0, min_time=1e-2):
+    """
+    Function to time each function in 'funcs' over a series of increasing input sizes.
+    'make_input(n)' returns the arguments for input size n, either as a tuple or a
+    single value. A fresh input is generated for every call, outside the timed region.
+    Calls are repeated until 'min_time' seconds have passed to reduce timer noise.
+    Measurement stops before the next input size if the runtime predicted from the
+    sizes measured so far would exceed the remaining part of 'time_budget'.
+    Returns the list of measured sizes and one list of runtimes per function.
+    """
+    measured = []
+    times = [[] for _ in funcs]
+    start = perf_counter()
+    for n in sizes:
+        if len(measured) >= 2:
+            # Extrapolate the cost of the next input size from the two previous sizes
+            call_times = [sum(t) for t in zip(*times)]
+            k = max(fit_exponent(measured[-2:], call_times[-2:]), 1.0)
+            predicted = sum(max(min_time, t[-1]*(n/measured[-1])**k) for t in times)
+            if perf_counter() - start + predicted > time_budget:
+                break
+        for func, func_times in zip(funcs, times):
+            elapsed = 0.0
+            calls = 0
+            while calls == 0 or (elapsed < min_time and perf_counter() - start < time_budget):
+                args = make_input(n)
+                if not isinstance(args, tuple):
+                    args = (args,)
+                t0 = perf_counter()
+                func(*args)
+                elapsed += perf_counter() - t0
+                calls += 1
+            func_times.append(elapsed/calls)
+        measured.append(n)
+        if perf_counter() - start > time_budget:
+            break
+    return measured, times
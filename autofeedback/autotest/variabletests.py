@@ -1,4 +1,4 @@
-from . import TestClass, compare_type, compare_values
+from . import TestClass, compare_type, compare_values, compare_signals
 
 
 class VariableTests(TestClass):
@@ -23,4 +23,14 @@ class VariableTests(TestClass):
 
             same_value, compare_msg = compare_values(x, y, rtol=rtol, atol=atol)
             msg = f'variable {"" if name is None else name} is a '+compare_msg
-            self.add_result(same_value, msg)
\ No newline at end of file
+            self.add_result(same_value, msg)
+
+    def compare_signals(self, x, y, name: str = None, rtol=1e-2, atol=1e-8, max_lag=None, fit_gain=False):
+        """
+        Compares signal @x with reference signal @y, accepting a delay of up to @max_lag
+        samples, a different length and, with @fit_gain, a constant scale factor.
+        The detected lag is reported in the feedback.
+        """
+        same_value, compare_msg = compare_signals(x, y, rtol=rtol, atol=atol, max_lag=max_lag, fit_gain=fit_gain)
+        msg = f'variable {"" if name is None else name}: '+compare_msg
+        self.add_result(same_value, msg)
@@ -0,0 +1,150 @@
+import os
+import sys
+import csv
+import json
+import argparse
+from glob import glob, has_magic
+from time import perf_counter
+from .feedback_generator import grade_notebooks
+from .watch import watch_notebooks
+from .zip_submissions import split_zip_path, zip_notebooks
+
+score_fields = ["notebook", "status", "points", "max_points", "report", "elapsed", "error"]
+
+
+def find_notebooks(paths):
+    """
+    Function to expand a list of notebook files, directories and glob patterns
+    to a sorted list of notebook files without duplicates. Directories are
+    searched recursively, skipping '.ipynb_checkpoints'. Zip archives are
+    expanded to the notebooks inside them, without extracting them.
+    """
+    notebooks = []
+    for path in paths:
+        if path.lower().endswith(".zip") and os.path.isfile(path):
+            found = zip_notebooks(path)
+        elif os.path.isdir(path):
+            found = sorted(glob(os.path.join(path, "**", "*.ipynb"), recursive=True))
+        elif has_magic(path):
+            found = sorted(glob(path, recursive=True))
+        else:
+            found = [path]
+        notebooks += [nb for nb in found if ".ipynb_checkpoints" not in nb.split(os.sep)]
+    return list(dict.fromkeys(notebooks))
+
+
+def write_scores(outcomes, filename, fmt=None):
+    """
+    Function to write notebook scores to 'filename' as JSON or CSV, with the
+    format 'fmt' chosen from the file extension unless given explicitly.
+    """
+    if fmt is None:
+        fmt = "csv" if filename.lower().endswith(".csv") else "json"
+    rows = [{field: outcome[field] for field in score_fields} for outcome in outcomes]
+    with open(filename, mode='w', encoding='utf-8', newline='') as f:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=score_fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, f, indent=1)
+
+
+def main(argv=None):
+    """
+    Command line entry point for batch grading of notebooks. Returns exit
+    status 1 if any notebook could not be graded.
+    """
+    parser = argparse.ArgumentParser(
+        prog="autofeedback-grade",
+        description="Grade jupyter notebooks with hidden tests and write HTML feedback reports.")
+    parser.add_argument("paths", nargs="+",
+                        help="notebook files, directories, glob patterns or zip archives")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="number of notebooks graded in parallel (default: 1)")
+    parser.add_argument("-o", "--output-dir", default="test_results",
+                        help="directory for HTML reports (default: test_results)")
+    parser.add_argument("-t", "--timeout", type=int, default=30,
+                        help="maximum execution time per cell in seconds (default: 30)")
+    parser.add_argument("--cache-dir",
+                        help="directory for executed notebooks reused across runs")
+    parser.add_argument("--deduplicate", action="store_true",
+                        help="execute identical submissions only once")
+    parser.add_argument("--journal",
+                        help="grading journal file, to resume an interrupted batch")
+    parser.add_argument("--results-db",
+                        help="SQLite database to append per-test results to")
+    parser.add_argument("--bundle",
+                        help="hidden test bundle to take hidden tests from")
+    parser.add_argument("--assets-dir",
+                        help="directory to store report images in once, instead of embedding them in each report")
+    parser.add_argument("--archive-dir",
+                        help="directory to keep compressed copies of the executed notebooks in")
+    parser.add_argument("--archive-size", type=float,
+                        help="maximum total size of the archive in MB, oldest notebooks are removed first")
+    parser.add_argument("--archive-format", choices=["gzip", "zstd"], default="gzip",
+                        help="compression of archived notebooks (default: gzip, zstd requires 'zstandard')")
+    parser.add_argument("--history",
+                        help="runtime history file, used to start the longest notebooks first")
+    parser.add_argument("--scores",
+                        help="file to write notebook scores to (.json or .csv)")
+    parser.add_argument("--scores-format", choices=["json", "csv"],
+                        help="format of the scores file (default: from file extension)")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and regrade notebooks when they are saved with changed code")
+    args = parser.parse_args(argv)
+
+    notebooks = find_notebooks(args.paths)
+    if args.cache_dir is not None:
+        cache_dir = os.path.abspath(args.cache_dir) + os.sep
+        notebooks = [nb for nb in notebooks if not os.path.abspath(nb).startswith(cache_dir)]
+    if len(notebooks) == 0:
+        parser.error("no notebooks found")
+
+    if args.watch:
+        ignored = [option for option, value in [("--workers", args.workers != 1), ("--cache-dir", args.cache_dir),
+                                                 ("--deduplicate", args.deduplicate), ("--journal", args.journal),
+                                                 ("--results-db", args.results_db), ("--history", args.history),
+                                                 ("--archive-dir", args.archive_dir), ("--scores", args.scores)]
+                   if value]
+        if len(ignored) > 0:
+            parser.error("--watch cannot be combined with %s" % ", ".join(ignored))
+        if any(split_zip_path(nb)[0] is not None for nb in notebooks):
+            parser.error("--watch does not support notebooks in zip archives")
+        watch_notebooks(notebooks, args.output_dir, timeout=args.timeout, bundle=args.bundle, assets_dir=args.assets_dir,
+                        callback=lambda msg: print(msg, flush=True))
+        return 0
+
+    outcomes = []
+    start = perf_counter()
+    for outcome in grade_notebooks(notebooks, args.output_dir, timeout=args.timeout, workers=args.workers,
+                                   deduplicate=args.deduplicate, cache_dir=args.cache_dir,
+                                   results_db=args.results_db, journal=args.journal, history=args.history,
+                                   bundle=args.bundle, assets_dir=args.assets_dir, archive_dir=args.archive_dir,
+                                   archive_size=None if args.archive_size is None else int(args.archive_size*2**20),
+                                   archive_format=args.archive_format):
+        outcomes.append(outcome)
+        rate = len(outcomes)/(perf_counter() - start)
+        if outcome['status'] == "failed":
+            result = "failed: %s" % outcome['error']
+        else:
+            result = "%s/%s%s" % (outcome['points'], outcome['max_points'],
+                                  " (already graded)" if outcome['status'] == "skipped" else "")
+        print("[%d/%d] %s: %s, %.1f s, %.2f notebooks/s" %
+              (len(outcomes), len(notebooks), outcome['notebook'], result, outcome['elapsed'], rate),
+              flush=True)
+
+    if args.scores is not None:
+        write_scores(outcomes, args.scores, args.scores_format)
+
+    failed = sum(outcome['status'] == "failed" for outcome in outcomes)
+    print("Graded %d notebooks in %.1f s, %d failed." % (len(outcomes), perf_counter() - start, failed))
+    predicted = [outcome['predicted_finish'] for outcome in outcomes if outcome['predicted_finish'] is not None]
+    if len(predicted) > 0:
+        print("Predicted completion time: %.1f s, actual: %.1f s." %
+              (max(predicted), max(outcome['finished'] for outcome in outcomes)))
+    return 1 if failed > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
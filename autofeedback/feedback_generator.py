@@ -1,60 +1,165 @@
 import nbformat
 
 import os
+import json
+import shutil
+import asyncio
+import hashlib
+from copy import deepcopy
+from functools import partial
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+from tempfile import mkdtemp
 from base64 import b64decode
-from nbgrader.preprocessors import Execute, ClearHiddenTests
+from importlib import metadata as importlib_metadata
+from nbgrader.preprocessors import ClearHiddenTests
 from nbgrader.utils import is_grade, determine_grade
 from nbconvert import HTMLExporter
 from IPython.display import Markdown, display
-from .preprocessors import InsertHiddenTests, PreservePlots, RemoveGCF
+from .preprocessors import InsertHiddenTests, PreservePlots, RemoveGCF, LimitedExecute
+from .test_bundle import load_bundle
+from .autotest.testclass import results_mime
+from .results_store import ResultsStore
+from .journal import GradingJournal, atomic_write, file_digest
+from .runtime_history import RuntimeHistory, schedule_longest_first
+from .report_assets import external_images
+from .archive import NotebookArchive
+from .zip_submissions import split_zip_path, read_submission, submission_digest, submission_dir, zip_data_digests
 
 #from nbconvert.preprocessors import ClearMetadataPreprocessor
 # Config Options
 output_dir = "test_results"
 test_tag = "autofeedback"
+# Matplotlib backend of grading kernels: non-interactive (Agg based) regardless of
+# the user's MPLBACKEND. Figures are rendered to PNG only, as other image formats
+# are dropped from the HTML report, and closed after each cell has been displayed.
+grading_backend = "module://matplotlib_inline.backend_inline"
+grading_kernel_arguments = ["--InlineBackend.figure_formats=png",
+                            "--InlineBackend.close_figures=True"]
 
 # Functions:
 # ----------
 
-def run_tests(filename, output_dir="test_results"):
-    """ 
-    Function to generate student feedback on code answers present
-    in the jupyter notebook "filename" based on hidden tests
-    created in nbgrader. Detailed results are written to
-    '/<output_dir>/<filename>.html', while acheived points and
-    max points are returned as (points, max_points).
+def collect_results(nb):
+    """
+    Function to collect grading results from the grade cells of an executed
+    notebook. Returns a list with one dictionary per grade cell, holding the
+    nbgrader grade id, points, max points and the per-test records displayed
+    by test classes with MIME type 'results_mime'. Each test record is tagged
+    with the index 'group' of the test class output it was read from.
+    """
+    results = []
+    for cell in nb.cells:
+        if is_grade(cell):
+            cell_points, cell_max_points = determine_grade(cell)
+            tests = []
+            group = 0
+            for output in cell.get('outputs', []):
+                if results_mime in output.get('data', {}):
+                    for test in output['data'][results_mime]['tests']:
+                        tests.append(dict(test, group=group))
+                    group += 1
+            results.append({'grade_id': cell.metadata.nbgrader.get('grade_id'),
+                            'points': 0 if cell_points is None else cell_points,
+                            'max_points': cell_max_points,
+                            'tests': tests})
+    return results
 
-    A prerequisite is the preprocessor "ObfuscateHiddenTests" having
-    been used to generate the student version rather than the standard
-    "ClearHiddenTests".
+def notebook_fingerprint(nb, data_digest="", bundle=None):
     """
-    # 1. Open notebook file and read to dictionary
+    Function to compute a fingerprint of everything that determines the grading
+    outcome of notebook 'nb': the code cell sources, with trailing whitespace
+    removed, together with their nbgrader and hidden test metadata. Markdown
+    cells are ignored. 'data_digest' identifies the data files available to the
+    notebook (see 'directory_digest'), so that notebooks reading different files
+    get different fingerprints.
+    If test bundle path 'bundle' is given, the hashes of bundled hidden tests
+    are included as well.
+    """
+    h = hashlib.sha256(data_digest.encode('utf-8'))
+    tests = {} if bundle is None else load_bundle(bundle).tests
+    for cell in nb.cells:
+        if cell.cell_type != 'code':
+            continue
+        source = "\n".join(line.rstrip() for line in cell.source.rstrip().split("\n"))
+        metadata = {key: cell.metadata.get(key) for key in ('nbgrader', test_tag)}
+        h.update(b"\0" + source.encode('utf-8'))
+        h.update(b"\0" + json.dumps(metadata, sort_keys=True).encode('utf-8'))
+        grade_id = cell.metadata.get('nbgrader', {}).get('grade_id')
+        if grade_id in tests:
+            h.update(b"\0" + tests[grade_id]['sha256'].encode('utf-8'))
+    return h.hexdigest()
+
+def directory_digest(path, exclude=()):
+    """
+    Function to compute a digest of the contents of all files other than
+    notebooks in directory 'path' and its subdirectories, which may be a
+    directory inside a zip archive. Files are identified by their path relative
+    to 'path'. Notebooks are executed in their own directory, so these are the
+    data files they can read. '.ipynb_checkpoints' and the directories in
+    'exclude' (e.g. the report directory) are skipped.
+    """
+    h = hashlib.sha256()
+    if split_zip_path(os.path.join(path, ""))[0] is not None:
+        data_files = zip_data_digests(path)
+    else:
+        skip = {os.path.abspath(directory) for directory in exclude}
+        data_files = []
+        for root, dirs, names in os.walk(path or '.'):
+            dirs[:] = [name for name in dirs if name != ".ipynb_checkpoints"
+                       and os.path.abspath(os.path.join(root, name)) not in skip]
+            for name in names:
+                if not name.endswith('.ipynb'):
+                    file = os.path.join(root, name)
+                    data_files.append((os.path.relpath(file, path or '.').replace(os.sep, "/"), file_digest(file)))
+        data_files.sort()
+    for name, digest in data_files:
+        h.update(name.encode('utf-8') + b"\0" + digest.encode('utf-8') + b"\0")
+    return h.hexdigest()
+
+def _package_version():
+    try:
+        return importlib_metadata.version("autofeedback")
+    except importlib_metadata.PackageNotFoundError:
+        return "unknown"
+
+def grading_key(fingerprint, timeout=30):
+    """
+    Function to extend notebook fingerprint 'fingerprint' with the grading
+    settings that also determine the outcome: the cell timeout 'timeout' and
+    the autofeedback version. Used to group notebooks and name cached results.
+    """
+    settings = "\0".join([fingerprint, str(timeout), _package_version()])
+    return hashlib.sha256(settings.encode('utf-8')).hexdigest()
+
+def _read_notebook(filename):
+    # Notebooks inside zip archives are streamed from the archive
+    if split_zip_path(filename)[0] is not None:
+        return nbformat.reads(read_submission(filename), as_version=4)
     with open(filename, 'r', encoding='utf-8') as f:
-        nb = nbformat.read(f, as_version=4)
+        return nbformat.read(f, as_version=4)
 
+def _grading_executor(timeout=30):
+    """
+    Function to create the preprocessor executing notebooks for grading, with
+    the matplotlib backend of the kernel set in the kernel's own environment.
+    """
+    return LimitedExecute(timeout=timeout, kernel_name='python3', extra_arguments=list(grading_kernel_arguments),
+                          kernel_env={"MPLBACKEND": grading_backend})
+
+
+def _insert_tests(nb, bundle=None):
     # 2. Copy hidden tests from metadata to cell body
-    InsertHiddenTests().preprocess(nb, None)
+    InsertHiddenTests(bundle=bundle or "").preprocess(nb, None)
     # Consider addin a "uniqueness-check" to nbgrader cell id. 
     # Purpose: avoid unwanted behavior when students copy test cells.
 
     # 3 Preserve Plots
     PreservePlots().preprocess(nb, None)
 
-    # 4. Execute entire notebook sequentially with hidden tests
-    Execute(timeout=30, kernel_name='python3').preprocess(nb, {'metadata': {'path': './'}})
-
-    # 5. Get student score
-    points = 0
-    max_points = 0
-    for cell in nb.cells:
-        if is_grade(cell):
-        #    max_points += get_max_points(cell)
-        #    points += get_points(cell)
-            cell_points, cell_max_points = determine_grade(cell)
-            points += 0 if cell_points is None else cell_points
-            max_points += cell_max_points
-
-    # 6. Remove hidden tests
+def _remove_tests(nb):
+    # 5. Remove hidden tests
     ClearHiddenTests().preprocess(nb, None)
 
     # Undo Preserve Plots
@@ -62,40 +167,434 @@ def run_tests(filename, output_dir="test_results"):
     
     # ClearMetadataPreprocessor().preprocess(nb_new, None)
 
-    # 7. Export notebook with test outputs to html file
+def _execute_notebook(nb, timeout=30, bundle=None, path='./'):
+    """
+    Function to run hidden tests in notebook 'nb' in place, leaving the test outputs
+    in the notebook and the hidden test code removed again. The kernel is started
+    in directory 'path'.
+    """
+    _insert_tests(nb, bundle)
+
+    # 4. Execute entire notebook sequentially with hidden tests
+    _grading_executor(timeout).preprocess(nb, {'metadata': {'path': path}})
+
+    _remove_tests(nb)
+
+async def _execute_notebook_async(nb, timeout=30, bundle=None, path='./'):
+    """
+    Coroutine version of '_execute_notebook'.
+    """
+    _insert_tests(nb, bundle)
+    await _grading_executor(timeout).async_preprocess(nb, {'metadata': {'path': path}})
+    _remove_tests(nb)
+
+def _in_thread(func, *args):
+    # Run blocking function 'func' (file access, HTML export) outside the event loop
+    return asyncio.get_running_loop().run_in_executor(None, partial(func, *args))
+
+@asynccontextmanager
+async def _submission_dir_async(filename, extract_dir=None):
+    # 'submission_dir' with extraction and clean-up of zip data files outside the event loop
+    context = submission_dir(filename, extract_dir)
+    path = await _in_thread(context.__enter__)
+    try:
+        yield path
+    finally:
+        await _in_thread(context.__exit__, None, None, None)
+
+def _copy_outputs(source_nb, target_nb):
+    """
+    Function to copy outputs of the code cells in executed notebook 'source_nb'
+    to the code cells of 'target_nb', which must have the same fingerprint.
+    """
+    source_cells = [cell for cell in source_nb.cells if cell.cell_type == 'code']
+    target_cells = [cell for cell in target_nb.cells if cell.cell_type == 'code']
+    for source_cell, target_cell in zip(source_cells, target_cells):
+        target_cell.outputs = deepcopy(source_cell.outputs)
+        target_cell.execution_count = source_cell.execution_count
+
+def report_path(filename, output_dir="test_results"):
+    """
+    Function to return the path of the HTML report for notebook 'filename'.
+    Notebooks below the current directory keep their relative directory
+    inside 'output_dir', other notebooks keep their absolute directory, so
+    that notebooks with the same name in different directories get separate
+    reports.
+    """
+    name = os.path.splitext(os.path.normpath(filename))[0]
+    if os.path.isabs(name) or name.split(os.sep)[0] == os.pardir:
+        drive, name = os.path.splitdrive(os.path.abspath(name))
+        name = os.path.join(drive.replace(":", ""), name.lstrip(os.sep))
+    return os.path.join(output_dir, name + ".html")
+
+def _write_report(nb, filename, output_dir, assets_dir=None):
+    # 6. Get student score
+    results = collect_results(nb)
+    points = sum(cell['points'] for cell in results)
+    max_points = sum(cell['max_points'] for cell in results)
+
+    # 7. Export notebook with test outputs to html file, with images stored
+    # separately in 'assets_dir' if given
+    report = report_path(filename, output_dir)
+    os.makedirs(os.path.dirname(report), exist_ok=True)
     html_exporter = HTMLExporter(template_name="classic")
-    (body, resources) = html_exporter.from_notebook_node(nb)
+    if assets_dir is not None:
+        with external_images(nb, assets_dir, os.path.dirname(report)):
+            (body, resources) = html_exporter.from_notebook_node(nb)
+    else:
+        (body, resources) = html_exporter.from_notebook_node(nb)
+    atomic_write(report, body)
+    return points, max_points, results
+
+def run_tests(filename, output_dir="test_results", return_results=False, timeout=30, bundle=None, assets_dir=None,
+              archive_dir=None, archive_size=None):
+    """ 
+    Function to generate student feedback on code answers present
+    in the jupyter notebook "filename" based on hidden tests
+    created in nbgrader. Detailed results are written to
+    '/<output_dir>/<filename>.html', while acheived points and
+    max points are returned as (points, max_points). Each cell
+    may run for at most 'timeout' seconds. Hidden tests are taken
+    from test bundle 'bundle' when given (see 'BundleHiddenTests').
+
+    A prerequisite is the preprocessor "ObfuscateHiddenTests" having
+    been used to generate the student version rather than the standard
+    "ClearHiddenTests".
+
+    With 'return_results' set, the per-cell results from 'collect_results'
+    are returned as well: (points, max_points, results).
+    With 'assets_dir' given, images are written to that directory as files
+    named by content hash, shared between reports, instead of being embedded
+    in the report.
+    With 'archive_dir' given, the executed notebook is also stored there as a
+    compressed file (see 'NotebookArchive'), keeping at most 'archive_size'
+    bytes of archived notebooks if given.
+    'filename' may point inside a zip archive, e.g. "submissions.zip/student/hw.ipynb",
+    in which case the notebook is executed next to the data files of its
+    directory in the archive (see 'submission_dir').
+    """
+    # 1. Open notebook file and read to dictionary
+    nb = _read_notebook(filename)
+
+    # 2.-5. Insert hidden tests, execute and remove hidden tests
+    with submission_dir(filename) as path:
+        _execute_notebook(nb, timeout, bundle, path)
+    archive = None
+    if archive_dir is not None:
+        archive = NotebookArchive(archive_dir, archive_size)
+        # The notebook is only changed again while images are stored in 'assets_dir'
+        archive.add(nb, filename, copy_nb=assets_dir is not None)
+
+    # 6.-7. Get student score and export report
+    try:
+        points, max_points, results = _write_report(nb, filename, output_dir, assets_dir)
+    finally:
+        if archive is not None:
+            archive.close()
+    if return_results:
+        return points, max_points, results
+    return points, max_points
+
+async def run_tests_async(filename, output_dir="test_results", return_results=False, timeout=30, bundle=None,
+                          assets_dir=None, archive_dir=None, archive_size=None):
+    """
+    Coroutine version of 'run_tests', taking the same arguments. The notebook is
+    executed with the async kernel client, and reading the notebook and exporting
+    the report are done in a worker thread, so that many notebooks can be graded
+    concurrently on one event loop (see 'grade_notebooks_async').
+    """
+    nb = await _in_thread(_read_notebook, filename)
+    async with _submission_dir_async(filename) as path:
+        await _execute_notebook_async(nb, timeout, bundle, path)
+    archive = None
+    if archive_dir is not None:
+        archive = NotebookArchive(archive_dir, archive_size)
+        # The notebook is only changed again while images are stored in 'assets_dir'
+        archive.add(nb, filename, copy_nb=assets_dir is not None)
 
-    with open(output_dir+'/'+filename.split(".")[0]+".html", mode='w', encoding='utf-8') as f:
-        f.write(body)
+    try:
+        points, max_points, results = await _in_thread(_write_report, nb, filename, output_dir, assets_dir)
+    finally:
+        if archive is not None:
+            await _in_thread(archive.close)
+    if return_results:
+        return points, max_points, results
     return points, max_points
 
-def autograde_notebooks(notebook_list):
+def _grade_group(notebooks, output_dir="test_results", timeout=30, key=None, cache_dir=None, bundle=None,
+                 assets_dir=None, archive=None, extract_dir=None):
+    """
+    Function to grade a group of notebooks sharing fingerprint 'key', executing
+    only the first notebook that can be executed and copying its outputs to the
+    rest. With 'cache_dir', executed notebooks are also stored by fingerprint
+    and reused across batches. Executed notebooks are added to NotebookArchive
+    'archive' if given. Data files of notebooks in zip archives are extracted
+    to 'extract_dir' if given (see 'submission_dir'). Returns one outcome
+    dictionary per notebook.
+    """
+    executed = None
+    cache_file = None
+    if key is not None and cache_dir is not None:
+        cache_file = os.path.join(cache_dir, key + ".ipynb")
+        if os.path.exists(cache_file):
+            executed = _read_notebook(cache_file)
+
+    outcomes = []
+    for notebook in notebooks:
+        start = perf_counter()
+        outcome = {'notebook': notebook, 'report': report_path(notebook, output_dir),
+                   'shared': executed is not None}
+        try:
+            nb = _read_notebook(notebook)
+            if executed is None:
+                with submission_dir(notebook, extract_dir) as path:
+                    _execute_notebook(nb, timeout, bundle, path)
+                if cache_file is not None:
+                    atomic_write(cache_file, nbformat.writes(nb))
+                executed = nb
+            else:
+                _copy_outputs(executed, nb)
+            if archive is not None:
+                outcome['archive'] = archive.add(nb, notebook, copy_nb=assets_dir is not None)
+            points, max_points, results = _write_report(nb, notebook, output_dir, assets_dir)
+        except Exception as e:
+            outcome.update(status="failed", points=None, max_points=None, results=None, error=repr(e))
+        else:
+            outcome.update(status="done", points=points, max_points=max_points, results=results, error=None)
+        outcome['elapsed'] = perf_counter() - start
+        outcomes.append(outcome)
+
+    if archive is not None:
+        errors = archive.wait()
+        for outcome in outcomes:
+            if outcome.get('archive') in errors:
+                outcome['error'] = "notebook could not be archived: " + repr(errors[outcome['archive']])
+    return outcomes
+
+def grade_notebooks(notebook_list, output_dir="test_results", timeout=30, workers=1,
+                    deduplicate=False, cache_dir=None, results_db=None, journal=None, history=None,
+                    bundle=None, assets_dir=None, archive_dir=None, archive_size=None, archive_format="gzip"):
+    """
+    Generator function to grade a list of jupyter notebook files, writing an
+    HTML report for each notebook to 'output_dir'. Yields one outcome dictionary
+    per notebook as soon as it is graded, holding 'notebook', 'status' ("done",
+    "skipped" or "failed"), 'points', 'max_points', 'report', 'elapsed', 'shared',
+    'results', 'error', 'finished' and 'predicted_finish'. Notebooks are graded
+    by 'workers' parallel processes, so outcomes are yielded in order of completion.
+
+    With 'deduplicate' set, notebooks with identical code, hidden tests and
+    data files (see 'notebook_fingerprint' and 'grading_key') are executed only once, and the
+    test outputs are shared between their reports. If 'cache_dir' is given,
+    executed notebooks are also stored there by fingerprint and reused by later
+    batches, which implies 'deduplicate'.
+    If 'results_db' is given, per-notebook, per-cell and per-test results
+    are appended to the SQLite results database at that path.
+    If 'journal' is given, each graded notebook is recorded in the grading
+    journal at that path. Notebooks recorded as graded with unchanged contents
+    are skipped when the batch is restarted, and notebooks that failed to grade
+    are retried.
+    If 'history' is given, execution times are recorded in the runtime history
+    file at that path, and notebooks expected to take longest are started first
+    to shorten the total grading time. 'finished' is then accompanied by the
+    predicted time 'predicted_finish' from the start of the batch.
+    Hidden tests are taken from test bundle 'bundle' when given.
+    With 'assets_dir' given, images in the reports are stored there once per
+    distinct image (see 'run_tests').
+    Notebooks may be members of zip archives (see 'run_tests'), which are read
+    by the grading processes without extracting the archive.
+    With 'archive_dir' given, executed notebooks are stored there compressed in
+    'archive_format' ("gzip" or "zstd"), keeping at most 'archive_size' bytes
+    (see 'NotebookArchive').
+    """
+    reports = {}
+    for notebook in notebook_list:
+        report = report_path(notebook, output_dir)
+        if report in reports:
+            raise ValueError("notebooks %s and %s would both be reported in %s." % (reports[report], notebook, report))
+        reports[report] = notebook
+    os.makedirs(output_dir, exist_ok=True)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    archive = None if archive_dir is None else NotebookArchive(archive_dir, archive_size, archive_format)
+    # Data files of notebooks in zip archives, extracted once per archive directory
+    extract_dir = mkdtemp(prefix="autofeedback-")
+
+    store = None if results_db is None else ResultsStore(results_db)
+    log = None if journal is None else GradingJournal(journal)
+    runtimes = None if history is None else RuntimeHistory(history)
+    digests = {}
+    predicted = {}
+    start = perf_counter()
+    try:
+        # Skip notebooks already graded according to the journal
+        pending = []
+        for notebook in notebook_list:
+            if log is not None:
+                digests[notebook] = submission_digest(notebook)
+                entry = log.completed(notebook, digests[notebook])
+                if entry is not None:
+                    yield {'notebook': notebook, 'status': "skipped", 'points': entry['points'],
+                           'max_points': entry['max_points'], 'report': entry['report'],
+                           'elapsed': 0.0, 'shared': False, 'results': None, 'error': None,
+                           'finished': perf_counter() - start, 'predicted_finish': None}
+                    continue
+            pending.append(notebook)
+
+        # Group notebooks by fingerprint
+        if deduplicate or cache_dir is not None:
+            groups = {}
+            data_digests = {}
+            for notebook in pending:
+                try:
+                    data_dir = os.path.dirname(notebook)
+                    if data_dir not in data_digests:
+                        data_digests[data_dir] = directory_digest(data_dir, [output_dir, cache_dir, assets_dir,
+                                                                             archive_dir])
+                    key = grading_key(notebook_fingerprint(_read_notebook(notebook), data_digests[data_dir], bundle),
+                                      timeout)
+                except Exception:
+                    key = notebook # Unreadable notebooks are left to fail on their own
+                groups.setdefault(key, []).append(notebook)
+            jobs = [(group, key if key != group[0] else None) for key, group in groups.items()]
+        else:
+            jobs = [([notebook], None) for notebook in pending]
+
+        # Start the longest expected jobs first
+        if runtimes is not None:
+            durations = [runtimes.predict(group[0]) for group, key in jobs]
+            order, finish = schedule_longest_first(durations, workers)
+            for (group, key), job_finish in zip(jobs, finish):
+                for notebook in group:
+                    predicted[notebook] = perf_counter() - start + job_finish
+            jobs = [jobs[i] for i in order]
+
+        def completed_outcomes():
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(_grade_group, group, output_dir, timeout, key, cache_dir, bundle,
+                                               assets_dir, archive, extract_dir)
+                               for group, key in jobs]
+                    for future in as_completed(futures):
+                        outcomes = future.result()
+                        if archive is not None:
+                            # The size limit of the archive is applied by this process
+                            for outcome in outcomes:
+                                if 'archive' in outcome:
+                                    archive.record(outcome['archive'])
+                        yield from outcomes
+            else:
+                for group, key in jobs:
+                    yield from _grade_group(group, output_dir, timeout, key, cache_dir, bundle, assets_dir, archive,
+                                            extract_dir)
+
+        for outcome in completed_outcomes():
+            notebook = outcome['notebook']
+            outcome['finished'] = perf_counter() - start
+            outcome['predicted_finish'] = predicted.get(notebook)
+            if runtimes is not None and outcome['status'] == "done" and not outcome['shared']:
+                runtimes.update(notebook, outcome['elapsed'])
+            if log is not None:
+                if outcome['status'] == "done":
+                    log.record(notebook, digests[notebook], "done", report=outcome['report'],
+                               points=outcome['points'], max_points=outcome['max_points'],
+                               elapsed=outcome['elapsed'])
+                else:
+                    log.record(notebook, digests[notebook], "failed",
+                               elapsed=outcome['elapsed'], error=outcome['error'])
+            if store is not None and outcome['status'] == "done":
+                store.add(notebook, outcome['points'], outcome['max_points'], outcome['results'],
+                          elapsed=outcome['elapsed'])
+            yield outcome
+    finally:
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        if archive is not None:
+            archive.close()
+        if runtimes is not None:
+            runtimes.save()
+        if store is not None:
+            store.close()
+        if log is not None:
+            log.close()
+
+async def grade_notebooks_async(notebook_list, output_dir="test_results", timeout=30, concurrency=4,
+                                bundle=None, assets_dir=None):
+    """
+    Asynchronous generator function to grade a list of jupyter notebook files
+    concurrently on the running event loop, executing at most 'concurrency'
+    notebooks at a time. For each notebook, a progress event with 'notebook'
+    and 'status' "running" is yielded when grading starts, followed by an
+    outcome dictionary as yielded by 'grade_notebooks' when it is finished,
+    with 'status' "done" or "failed". Events are yielded in the order they
+    happen. Notebooks still being graded are cancelled when the generator
+    is closed before all events are yielded.
+    See 'run_tests' for the 'bundle' and 'assets_dir' options.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # Data files of notebooks in zip archives, extracted once per archive directory
+    extract_dir = mkdtemp(prefix="autofeedback-")
+    events = asyncio.Queue()
+    semaphore = asyncio.Semaphore(concurrency)
+    start = perf_counter()
+
+    async def grade(notebook):
+        async with semaphore:
+            await events.put({'notebook': notebook, 'status': "running", 'finished': None})
+            task_start = perf_counter()
+            outcome = {'notebook': notebook, 'report': report_path(notebook, output_dir), 'shared': False}
+            try:
+                nb = await _in_thread(_read_notebook, notebook)
+                async with _submission_dir_async(notebook, extract_dir) as path:
+                    await _execute_notebook_async(nb, timeout, bundle, path)
+                points, max_points, results = await _in_thread(_write_report, nb, notebook, output_dir, assets_dir)
+            except Exception as e:
+                outcome.update(status="failed", points=None, max_points=None, results=None, error=repr(e))
+            else:
+                outcome.update(status="done", points=points, max_points=max_points, results=results, error=None)
+            outcome['elapsed'] = perf_counter() - task_start
+            outcome['finished'] = perf_counter() - start
+            outcome['predicted_finish'] = None
+            await events.put(outcome)
+
+    tasks = [asyncio.ensure_future(grade(notebook)) for notebook in notebook_list]
+    try:
+        for _ in range(2*len(tasks)):
+            yield await events.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await _in_thread(shutil.rmtree, extract_dir, True)
+
+def autograde_notebooks(notebook_list, results_db=None, deduplicate=False, journal=None, workers=1, bundle=None):
     """
     Function to run autograding on list of jupyter notebook files.
     Jupyter notebook files are assumed to be assignment files created using
     nbgrader, with the addition of hidden tests being copied to metadata
     for each grade cell.
+    See 'grade_notebooks' for the 'results_db', 'deduplicate', 'journal',
+    'workers' and 'bundle' options.
     """
     total_score = 0
     max_score = 0
 
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    for notebook in notebook_list:
-        notebook_score, notebook_max = run_tests(notebook)
-        report_file = notebook.split(".")[0]+".html"
+    for outcome in grade_notebooks(notebook_list, output_dir, results_db=results_db,
+                                   deduplicate=deduplicate, journal=journal, workers=workers, bundle=bundle):
+        notebook = outcome['notebook']
+        if outcome['status'] == "failed":
+            display(Markdown("""%s could not be graded: %s""" % (notebook, outcome['error'])))
+            continue
+        report_file = os.path.relpath(outcome['report'], output_dir)
         display(Markdown(
-            """%s graded, score: %s/%s. See [%s](test_results/%s) for detailed report.""" %
+            """%s %s, score: %s/%s. See [%s](test_results/%s) for detailed report.""" %
             (notebook,
-             str(notebook_score),
-             str(notebook_max),
+             "already graded" if outcome['status'] == "skipped" else "graded",
+             str(outcome['points']),
+             str(outcome['max_points']),
              report_file,
              report_file)
         ))
-        total_score += notebook_score
-        max_score += notebook_max
+        total_score += outcome['points']
+        max_score += outcome['max_points']
     display(Markdown(
         """Finished grading all tasks! Final score: %s/%s.""" %
         (str(total_score),
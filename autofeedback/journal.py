@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+def file_digest(filename):
+    """
+    Function to compute the SHA-256 digest of the contents of file 'filename'.
+    """
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def atomic_write(filename, text):
+    """
+    Function to write string (or bytes) 'text' to file 'filename' so that the file
+    either keeps its old contents or holds the complete new contents, even if the
+    process is interrupted while writing. The temporary file is unique per process
+    and thread, so the same file may be written concurrently.
+    """
+    tmp_name = "%s.%d.%d.tmp" % (filename, os.getpid(), threading.get_ident())
+    binary = isinstance(text, bytes)
+    with open(tmp_name, mode='wb' if binary else 'w', encoding=None if binary else 'utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_name, filename)
+
+
+class GradingJournal:
+    """
+    Append-only manifest of graded notebooks, stored as one JSON object per line.
+    An entry is written after each notebook, with the digest of the notebook file,
+    status ("done" or "failed"), score, report path and timings. Entries are flushed
+    to disk immediately, so a restarted batch can skip notebooks already graded.
+    A partially written last line from an interrupted run is ignored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        complete_line = True
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    complete_line = line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry['notebook']] = entry
+        self.file = open(path, 'a', encoding='utf-8')
+        if not complete_line:
+            # Terminate partial line left by an interrupted run
+            self.file.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def completed(self, notebook: str, digest: str):
+        """
+        Returns the journal entry of @notebook if it was graded successfully with
+        file digest @digest and its report still exists, otherwise None.
+        """
+        entry = self.entries.get(notebook)
+        if entry is None or entry['status'] != "done" or entry['digest'] != digest:
+            return None
+        if not os.path.exists(entry['report']):
+            return None
+        return entry
+
+    def record(self, notebook: str, digest: str, status: str, report: str = None,
+               points: float = None, max_points: float = None, elapsed: float = None, error: str = None):
+        """
+        Appends an entry for @notebook to the journal and flushes it to disk.
+        """
+        entry = {"notebook": notebook,
+                 "digest": digest,
+                 "status": status,
+                 "report": report,
+                 "points": points,
+                 "max_points": max_points,
+                 "elapsed": elapsed,
+                 "finished_at": time.time(),
+                 "error": error}
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.entries[notebook] = entry
+        return entry
@@ -1,15 +1,58 @@
 from nbgrader import utils
-from nbgrader.preprocessors import NbGraderPreprocessor
+from nbgrader.preprocessors import NbGraderPreprocessor, Execute
+from nbgrader.preprocessors.execute import UnresponsiveKernelError
 from nbconvert.exporters.exporter import ResourcesDict
+from nbclient import NotebookClient
+from nbclient.util import run_sync
 from nbformat.notebooknode import NotebookNode
 from typing import Tuple
 from base64 import b64decode, b64encode
-from traitlets import Unicode, Bool
+from traitlets import Unicode, Bool, Enum, Integer, Dict
 from textwrap import dedent
+from copy import deepcopy
+from collections import deque
+import os
+import zlib
+import atexit
+import lzma
+from .test_bundle import TestBundle, load_bundle
+from .autotest.plotchecker import reference_hash_attr, plot_hash_mime
 
 hidden_test_tag = "autofeedback"
 plot_tag = "plot_task"
 test_code_tag = "test_code"
+test_format_tag = "test_code_format"
+plot_hash_tag = "plot_hash"
+
+# Compression applied before base64 encoding, keyed by format marker
+_compressors = {"zlib": (lambda data: zlib.compress(data, 9), zlib.decompress),
+                "lzma": (lzma.compress, lzma.decompress)}
+
+
+def encode_hidden_tests(test_string: str, compression: str = "none") -> dict:
+    """
+    Encode hidden test code as metadata for the "autofeedback" cell metadata entry.
+    With @compression "zlib" or "lzma", the code is compressed before base64 encoding,
+    and the format is recorded under "test_code_format".
+    """
+    data = bytes(test_string, 'utf8')
+    if compression == "none":
+        return {test_code_tag: b64encode(data).decode('utf-8')}
+    compress, _ = _compressors[compression]
+    return {test_code_tag: b64encode(compress(data)).decode('utf-8'), test_format_tag: compression}
+
+
+def decode_hidden_tests(metadata: dict) -> str:
+    """
+    Decode hidden test code from the "autofeedback" cell metadata entry, in either
+    the plain base64 format or one of the compressed formats.
+    """
+    data = b64decode(metadata[test_code_tag])
+    compression = metadata.get(test_format_tag, "none")
+    if compression != "none":
+        _, decompress = _compressors[compression]
+        data = decompress(data)
+    return data.decode('utf-8')
 
 
 class TagPlotCells(NbGraderPreprocessor):
@@ -47,10 +90,15 @@ class PreservePlots(NbGraderPreprocessor):
                         new_lines.append(line)
 
                 # Make sure gcf() is available
-                new_lines.insert(0, "from matplotlib.pyplot import gcf")
+                new_lines.insert(0, "from matplotlib.pyplot import gcf, get_fignums")
 
-                # Add active figure to variable "fig"
-                new_lines.append("fig = gcf()")
+                # Add active figure to variable "fig", without creating an empty figure
+                # (which would be rendered) if the cell did not plot anything
+                new_lines.append("fig = gcf() if len(get_fignums()) > 0 else None")
+
+                # Attach reference hash of the plot, for comparison of rendered figures
+                if plot_hash_tag in cell['metadata'][hidden_test_tag]:
+                    new_lines.append("if fig is not None: fig.%s = %r" % (reference_hash_attr, cell['metadata'][hidden_test_tag][plot_hash_tag]))
 
                 cell.source = "\n".join(new_lines)
 
@@ -66,11 +114,220 @@ class RemoveGCF(NbGraderPreprocessor):
         if utils.is_solution(cell):
             if cell['metadata'].get(hidden_test_tag, False) and cell['metadata'][hidden_test_tag].get(plot_tag, False):
                 lines = cell.source.split("\n")
-                if "from matplotlib.pyplot import gcf" in lines[0] and "fig = gcf()" in lines[-1]:
+                if lines[-1].startswith("if fig is not None: fig.%s" % reference_hash_attr):
+                    lines = lines[:-1]
+                if lines[0].startswith("from matplotlib.pyplot import gcf") and lines[-1].startswith("fig = gcf()"):
                     cell.source = "\n".join(lines[1:-1])
 
         return cell, resources
 
+class HashReferencePlots(NbGraderPreprocessor):
+    """
+    A preprocessor storing a perceptual hash of the figure made by each plot task in
+    the metadata of the plot task cell, for comparison with rendered student figures.
+    The notebook, which must contain the solutions, is executed without its grade
+    cells on a copy, so the notebook itself is left unchanged apart from the metadata.
+    """
+
+    timeout = Integer(
+        30,
+        help="Maximum execution time per cell in seconds"
+    ).tag(config=True)
+
+    def preprocess(self, nb: NotebookNode, resources: ResourcesDict) -> Tuple[NotebookNode, ResourcesDict]:
+        from .feedback_generator import _grading_executor
+
+        plot_cells = {}
+        executed = deepcopy(nb)
+        executed.cells = []
+        for cell in nb.cells:
+            if cell.cell_type != 'code' or utils.is_grade(cell):
+                continue
+            executed.cells.append(deepcopy(cell))
+            if utils.is_solution(cell) and cell['metadata'].get(hidden_test_tag, {}).get(plot_tag, False):
+                plot_cells[len(executed.cells) - 1] = cell
+        if len(plot_cells) == 0:
+            return nb, resources
+
+        PreservePlots().preprocess(executed, None)
+        for index in plot_cells:
+            executed.cells[index].source += ("\nfrom autofeedback.autotest.plotchecker import display_figure_hash"
+                                             "\ndisplay_figure_hash(fig)")
+        path = (resources or {}).get('metadata', {}).get('path') or './'
+        _grading_executor(self.timeout).preprocess(executed, {'metadata': {'path': path}})
+
+        for index, cell in plot_cells.items():
+            for output in executed.cells[index].outputs:
+                if plot_hash_mime in output.get('data', {}):
+                    cell['metadata'][hidden_test_tag][plot_hash_tag] = output['data'][plot_hash_mime]['hash']
+        return nb, resources
+
+
+class LimitedExecute(Execute):
+    """
+    An Execute preprocessor limiting the output kept per cell while the cell is
+    running. Beyond the limits, only the first and last part of each output stream,
+    and the first and last display outputs, are kept, with a marker noting how much
+    output was left out. Outputs updated by display id and errors are not limited.
+    """
+
+    max_stream_chars = Integer(
+        100000,
+        help="Maximum number of characters kept per output stream (stdout/stderr) of a cell, half from the start and half from the end"
+    ).tag(config=True)
+
+    max_display_outputs = Integer(
+        50,
+        help="Maximum number of display outputs (figures, rich output) kept per cell, half from the start and half from the end"
+    ).tag(config=True)
+
+    kernel_env = Dict(
+        {},
+        help="Environment variables set for the kernel in addition to those of the grading process"
+    ).tag(config=True)
+
+    def __init__(self, *args, **kwargs):
+        super(LimitedExecute, self).__init__(*args, **kwargs)
+        self._limited = {}
+
+    async def async_start_new_kernel(self, **kwargs):
+        if self.kernel_env:
+            kwargs['env'] = dict(kwargs.get('env', os.environ), **self.kernel_env)
+        return await super(LimitedExecute, self).async_start_new_kernel(**kwargs)
+
+    start_new_kernel = run_sync(async_start_new_kernel)
+
+    def _cell_limits(self, cell_index: int) -> dict:
+        if cell_index not in self._limited:
+            self._limited[cell_index] = {'chars': {}, 'streams': {}, 'displays': 0, 'display_tail': None}
+        return self._limited[cell_index]
+
+    def output(self, outs, msg, display_id, cell_index):
+        if self.clear_before_next_output:
+            self._limited.pop(cell_index, None)
+        msg_type = msg['msg_type']
+        parent_msg_id = msg['parent_header'].get('msg_id')
+        if display_id or self.output_hook_stack[parent_msg_id]:
+            return super(LimitedExecute, self).output(outs, msg, display_id, cell_index)
+        limits = self._cell_limits(cell_index)
+        head_chars, head_displays = self.max_stream_chars // 2, self.max_display_outputs // 2
+
+        if msg_type == 'stream':
+            name, text = msg['content']['name'], msg['content']['text']
+            seen = limits['chars'].get(name, 0)
+            limits['chars'][name] = seen + len(text)
+            if seen + len(text) <= head_chars:
+                return super(LimitedExecute, self).output(outs, msg, display_id, cell_index)
+            out = None
+            if seen < head_chars:
+                msg = dict(msg, content=dict(msg['content'], text=text[:head_chars - seen]))
+                out = super(LimitedExecute, self).output(outs, msg, display_id, cell_index)
+                text = text[head_chars - seen:]
+            if name not in limits['streams']:
+                # Placeholder output at the position of the omitted output, filled in
+                # with the end of the stream when the cell has finished
+                placeholder = NotebookNode(output_type='stream', name=name, text="")
+                outs.append(placeholder)
+                limits['streams'][name] = [placeholder, deque(), 0]
+            _, chunks, length = limits['streams'][name]
+            chunks.append(text)
+            length += len(text)
+            while length - len(chunks[0]) >= self.max_stream_chars - head_chars:
+                length -= len(chunks.popleft())
+            limits['streams'][name][2] = length
+            return out
+
+        if msg_type in ('display_data', 'execute_result'):
+            limits['displays'] += 1
+            if limits['displays'] <= head_displays:
+                return super(LimitedExecute, self).output(outs, msg, display_id, cell_index)
+            if limits['display_tail'] is None:
+                placeholder = NotebookNode(output_type='stream', name='stdout', text="")
+                outs.append(placeholder)
+                limits['display_tail'] = (placeholder, deque(maxlen=self.max_display_outputs - head_displays))
+            # Output objects are only created for the outputs kept at the end
+            limits['display_tail'][1].append(msg)
+            return None
+
+        return super(LimitedExecute, self).output(outs, msg, display_id, cell_index)
+
+    def clear_output(self, outs, msg, cell_index):
+        super(LimitedExecute, self).clear_output(outs, msg, cell_index)
+        if not self.clear_before_next_output:
+            self._limited.pop(cell_index, None)
+
+    def on_cell_executed(self, **kwargs):
+        # Fill in the end of limited streams, and the last display outputs after a marker
+        cell, cell_index = kwargs['cell'], kwargs['cell_index']
+        limits = self._limited.pop(cell_index, None)
+        if limits is not None:
+            head_chars, head_displays = self.max_stream_chars // 2, self.max_display_outputs // 2
+            for name, (placeholder, chunks, _) in limits['streams'].items():
+                tail = "".join(chunks)[-(self.max_stream_chars - head_chars):]
+                omitted = limits['chars'][name] - head_chars - len(tail)
+                placeholder.text = ("\n... [%d characters of output omitted] ...\n" % omitted if omitted > 0 else "") + tail
+            if limits['display_tail'] is not None:
+                placeholder, msgs = limits['display_tail']
+                omitted = limits['displays'] - head_displays - len(msgs)
+                placeholder.text = "\n... [%d outputs omitted] ...\n" % omitted if omitted > 0 else ""
+                tail = []
+                for msg in msgs:
+                    super(LimitedExecute, self).output(tail, msg, None, cell_index)
+                for i, output in enumerate(cell.outputs):
+                    if output is placeholder:
+                        cell.outputs[i + 1:i + 1] = tail
+                        self._shift_display_ids(cell_index, i, len(tail))
+                        break
+        return super(LimitedExecute, self).on_cell_executed(**kwargs)
+
+    def _shift_display_ids(self, cell_index: int, position: int, count: int):
+        # Keep recorded positions of outputs with display ids valid after inserting outputs
+        for cell_map in self._display_id_map.values():
+            if cell_index in cell_map:
+                cell_map[cell_index] = [i + count if i > position else i for i in cell_map[cell_index]]
+
+    def _check_retry(self, attempt: int, error: Exception):
+        # Re-executes notebooks whose kernel failed up to 'execute_retries' times, as
+        # earlier nbgrader versions did, then raises UnresponsiveKernelError
+        if attempt >= self.execute_retries:
+            raise UnresponsiveKernelError() from error
+        self.log.warning("Failed to execute notebook, trying again (%d/%d)", attempt + 1, self.execute_retries)
+        self._limited = {}
+
+    def preprocess(self, nb: NotebookNode, resources: ResourcesDict = None, km=None):
+        attempt = 0
+        while True:
+            try:
+                return super(LimitedExecute, self).preprocess(nb, resources, km)
+            except RuntimeError as e:
+                self._check_retry(attempt, e)
+                attempt += 1
+
+    async def async_preprocess(self, nb: NotebookNode, resources: ResourcesDict = None, **kwargs):
+        """
+        Coroutine version of preprocess, executing notebook @nb with the async kernel
+        client so that several notebooks can be executed concurrently on one event loop.
+        Notebooks are retried on kernel failure like in preprocess. Keyword arguments
+        (e.g. env) are passed on to the kernel manager starting the kernel.
+        """
+        attempt = 0
+        while True:
+            NotebookClient.__init__(self, nb)
+            self._check_assign_resources(resources)
+            try:
+                await self.async_execute(**kwargs)
+                return self.nb, self.resources
+            except RuntimeError as e:
+                self._check_retry(attempt, e)
+                attempt += 1
+            finally:
+                # When cancelled while the kernel starts, nbclient leaves its exit handler
+                # registered and the kernel may be left running
+                atexit.unregister(self._cleanup_kernel)
+                if self.km is not None and self.km.has_kernel:
+                    await self._async_cleanup_kernel()
+
+
 class NoCellsDeletable(NbGraderPreprocessor):
     """A preprocessor to tag every cell in the assignment as "deletable": false"""
     
@@ -100,7 +357,74 @@ class LockMarkdownCells(NbGraderPreprocessor):
 
 class InsertHiddenTests(NbGraderPreprocessor):
     """A preprocessor for making sure a plot object created by a plotting task is available in variable 'fig'."""
-    
+
+    bundle = Unicode(
+        "",
+        help=dedent(
+            """
+            Path of a hidden test bundle written by BundleHiddenTests. Grade cells
+            found in the bundle get their hidden tests from the bundle instead of
+            from cell metadata. Precompiled tests are run from the bundle by the
+            kernel directly.
+            """
+        )
+    ).tag(config=True)
+
+    def preprocess(self, nb: NotebookNode, resources: ResourcesDict) -> Tuple[NotebookNode, ResourcesDict]:
+        self._bundle = load_bundle(self.bundle) if self.bundle else None
+        return super(InsertHiddenTests, self).preprocess(nb, resources)
+
+    def preprocess_cell(self,
+                        cell: NotebookNode,
+                        resources: ResourcesDict,
+                        cell_index: int
+                        ) -> Tuple[NotebookNode, ResourcesDict]:
+        if cell.cell_type == 'code' and utils.is_grade(cell):
+            grade_id = cell['metadata']['nbgrader'].get('grade_id')
+            if self._bundle is not None and grade_id in self._bundle.tests:
+                if 'code' in self._bundle.tests[grade_id]:
+                    test_string = ("from autofeedback.test_bundle import run_hidden_test\n"
+                                   "run_hidden_test(%r, %r, globals())" % (os.path.abspath(self.bundle), grade_id))
+                else:
+                    test_string = self._bundle.tests[grade_id]['source']
+            elif cell['metadata'].get(hidden_test_tag, False) and cell['metadata'][hidden_test_tag].get(test_code_tag, False):
+                test_string = decode_hidden_tests(cell['metadata'][hidden_test_tag])
+            else:
+                return cell, resources
+            cell['source'] += "\n### BEGIN HIDDEN TESTS\n"+test_string+"\n### END HIDDEN TESTS"
+
+        return cell, resources
+
+
+class BundleHiddenTests(NbGraderPreprocessor):
+    """A preprocessor collecting hidden tests from cell metadata into a central test bundle for the assignment."""
+
+    bundle = Unicode(
+        "hidden_tests.json",
+        help="Path of the hidden test bundle. Existing bundles are updated."
+    ).tag(config=True)
+
+    compile_tests = Bool(
+        True,
+        help="Whether to store compiled code objects for the running Python version in the bundle"
+    ).tag(config=True)
+
+    remove_tests = Bool(
+        False,
+        help=dedent(
+            """
+            Whether to remove hidden tests from cell metadata after adding them to
+            the bundle. The notebooks can then only be graded with the bundle.
+            """
+        )
+    ).tag(config=True)
+
+    def preprocess(self, nb: NotebookNode, resources: ResourcesDict) -> Tuple[NotebookNode, ResourcesDict]:
+        self._bundle = TestBundle.load(self.bundle) if os.path.exists(self.bundle) else TestBundle()
+        nb, resources = super(BundleHiddenTests, self).preprocess(nb, resources)
+        self._bundle.save(self.bundle)
+        return nb, resources
+
     def preprocess_cell(self,
                         cell: NotebookNode,
                         resources: ResourcesDict,
@@ -108,8 +432,11 @@ class InsertHiddenTests(NbGraderPreprocessor):
                         ) -> Tuple[NotebookNode, ResourcesDict]:
         if cell.cell_type == 'code' and utils.is_grade(cell):
             if cell['metadata'].get(hidden_test_tag, False) and cell['metadata'][hidden_test_tag].get(test_code_tag, False):
-                test_string = b64decode(cell['metadata'][hidden_test_tag][test_code_tag]).decode('utf-8')
-                cell['source'] += "\n### BEGIN HIDDEN TESTS\n"+test_string+"\n### END HIDDEN TESTS"
+                test_string = decode_hidden_tests(cell['metadata'][hidden_test_tag])
+                self._bundle.add(cell['metadata']['nbgrader']['grade_id'], test_string, self.compile_tests)
+                if self.remove_tests:
+                    del cell['metadata'][hidden_test_tag][test_code_tag]
+                    cell['metadata'][hidden_test_tag].pop(test_format_tag, None)
 
         return cell, resources
 
@@ -126,6 +453,12 @@ class ObfuscateHiddenTests(NbGraderPreprocessor):
         help="The delimiter marking the end of hidden tests cases"
     ).tag(config=True)
 
+    compression = Enum(
+        ["none", "zlib", "lzma"],
+        default_value="none",
+        help="Compression applied to hidden tests before base64 encoding them in cell metadata"
+    ).tag(config=True)
+
     enforce_metadata = Bool(
         True,
         help=dedent(
@@ -188,8 +521,7 @@ class ObfuscateHiddenTests(NbGraderPreprocessor):
 
         if removed_test:
             test_string = "\n".join(test_lines)
-            test_string_encoded = b64encode(bytes(test_string, 'utf8')).decode('utf-8')
-            cell.metadata[hidden_test_tag] = {'test_code': test_string_encoded}
+            cell.metadata[hidden_test_tag] = encode_hidden_tests(test_string, self.compression)
 
         return removed_test
 
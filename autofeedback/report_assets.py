@@ -0,0 +1,75 @@
+import os
+import hashlib
+import threading
+from base64 import b64decode
+from contextlib import contextmanager
+from .journal import atomic_write
+
+# Image formats written to the assets directory, with file extensions. These are
+# referenced through the 'filenames' output metadata supported by the HTML templates.
+image_extensions = {"image/png": ".png", "image/jpeg": ".jpg", "image/gif": ".gif"}
+
+# Assets written by this process, so that each image is only checked once per batch.
+# Reports may be exported by several threads (see 'grade_notebooks_async').
+_stored = set()
+_stored_lock = threading.Lock()
+
+
+def store_asset(data: bytes, extension: str, assets_dir: str) -> str:
+    """
+    Function to store 'data' in 'assets_dir' in a file named by the SHA-256 hash of
+    the contents, unless an identical file is already stored. Returns the file path.
+    """
+    path = os.path.join(assets_dir, hashlib.sha256(data).hexdigest() + extension)
+    with _stored_lock:
+        if path not in _stored:
+            if not os.path.exists(path):
+                os.makedirs(assets_dir, exist_ok=True)
+                atomic_write(path, data)
+            _stored.add(path)
+    return path
+
+
+@contextmanager
+def external_images(nb, assets_dir: str, report_dir: str):
+    """
+    Context manager to reference the image outputs and markdown image attachments of
+    notebook 'nb' from files in 'assets_dir' instead of embedding them in exported
+    HTML. Images are stored once per distinct content (see 'store_asset'), and
+    referenced by paths relative to 'report_dir'. The notebook is restored on exit.
+    """
+    def reference(data, mime):
+        path = store_asset(b64decode(data), image_extensions[mime], assets_dir)
+        return os.path.relpath(path, report_dir).replace(os.sep, "/")
+
+    outputs, markdown = [], []
+    try:
+        for cell in nb.cells:
+            if cell.cell_type == 'code':
+                for output in cell.get('outputs', []):
+                    images = {mime: data for mime, data in output.get('data', {}).items() if mime in image_extensions}
+                    if len(images) > 0:
+                        metadata = output.setdefault('metadata', {})
+                        outputs.append((output, metadata.get('filenames')))
+                        metadata['filenames'] = dict(metadata.get('filenames', {}),
+                                                     **{mime: reference(data, mime) for mime, data in images.items()})
+            elif cell.cell_type == 'markdown' and len(cell.get('attachments', {})) > 0:
+                markdown.append((cell, cell.source, cell.attachments))
+                remaining = {}
+                for name, bundle in cell.attachments.items():
+                    mime = next((mime for mime in bundle if mime in image_extensions), None)
+                    if mime is None:
+                        remaining[name] = bundle
+                    else:
+                        cell.source = cell.source.replace("attachment:" + name, reference(bundle[mime], mime))
+                cell.attachments = remaining
+        yield nb
+    finally:
+        for output, filenames in outputs:
+            if filenames is None:
+                del output.metadata['filenames']
+            else:
+                output.metadata['filenames'] = filenames
+        for cell, source, attachments in markdown:
+            cell.source = source
+            cell.attachments = attachments
@@ -0,0 +1,143 @@
+import sqlite3
+import time
+import numpy as np
+
+# Schema of the results database. Rows are only ever appended, so re-grading a
+# notebook adds a new submission, and queries use the latest submission per notebook.
+_schema = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    notebook TEXT NOT NULL,
+    points REAL,
+    max_points REAL,
+    elapsed REAL,
+    graded_at REAL
+);
+CREATE TABLE IF NOT EXISTS cells (
+    submission INTEGER NOT NULL,
+    grade_id TEXT,
+    points REAL,
+    max_points REAL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    submission INTEGER NOT NULL,
+    grade_id TEXT,
+    grp INTEGER,
+    test_id INTEGER,
+    passed INTEGER,
+    weight REAL,
+    elapsed REAL,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS submissions_notebook ON submissions (notebook, id);
+CREATE INDEX IF NOT EXISTS cells_submission ON cells (submission);
+CREATE INDEX IF NOT EXISTS tests_submission ON tests (submission);
+CREATE INDEX IF NOT EXISTS tests_test ON tests (grade_id, grp, test_id);
+CREATE VIEW IF NOT EXISTS latest AS
+    SELECT max(id) AS submission FROM submissions GROUP BY notebook;
+"""
+
+
+class ResultsStore:
+    """
+    Append-only store of grading results in a local SQLite database, with one row per
+    graded notebook, per grade cell and per test. The database runs in WAL mode, so
+    several grading processes may write to the same file concurrently.
+
+    Example usage:
+    ----------------------
+    with ResultsStore("test_results/results.db") as store:
+        points, max_points, results = run_tests("assignment.ipynb", return_results=True)
+        store.add("assignment.ipynb", points, max_points, results)
+        store.pass_rates()[:5] # Five tests with the lowest pass rate
+    ----------------------
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def add(self, notebook: str, points: float, max_points: float, results: list, elapsed: float = None):
+        """
+        Appends the grading results of notebook @notebook, where @results is the list of
+        per-cell results returned by 'collect_results'. Returns the submission id.
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO submissions (notebook, points, max_points, elapsed, graded_at) VALUES (?, ?, ?, ?, ?)",
+                (notebook, points, max_points, elapsed, time.time()))
+            submission = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT INTO cells VALUES (?, ?, ?, ?)",
+                [(submission, cell['grade_id'], cell['points'], cell['max_points']) for cell in results])
+            self.conn.executemany(
+                "INSERT INTO tests VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(submission, cell['grade_id'], test.get('group', 0), test['id'], test['passed'],
+                  test['weight'], test['elapsed'], test['message'])
+                 for cell in results for test in cell['tests']])
+        return submission
+
+    def _column(self, query: str, params=()):
+        # Read a single numeric column straight into a numpy array
+        cursor = self.conn.execute(query, params)
+        return np.fromiter((row[0] for row in cursor), dtype=float)
+
+    def _filter(self, latest: bool):
+        return " AND submission IN (SELECT submission FROM latest)" if latest else ""
+
+    def pass_rates(self, grade_id: str = None, latest: bool = True):
+        """
+        Returns a list of (grade_id, group, test_id, pass_rate, count) tuples for every
+        test, optionally restricted to grade cell @grade_id, sorted by ascending pass rate.
+        With @latest, only the most recent submission of each notebook is counted.
+        """
+        query = "SELECT grade_id, grp, test_id, avg(passed), count(*) FROM tests WHERE (? IS NULL OR grade_id = ?)"
+        query += self._filter(latest)
+        query += " GROUP BY grade_id, grp, test_id ORDER BY avg(passed), grade_id, grp, test_id"
+        return self.conn.execute(query, (grade_id, grade_id)).fetchall()
+
+    def scores(self, grade_id: str = None, latest: bool = True):
+        """
+        Returns an array of scores normalized to 0.0 <= score <= 1.0, either for whole
+        notebooks or for grade cell @grade_id.
+        """
+        if grade_id is None:
+            query = "SELECT points/max_points FROM submissions WHERE max_points > 0"
+            query += " AND id IN (SELECT submission FROM latest)" if latest else ""
+            return self._column(query)
+        query = "SELECT points/max_points FROM cells WHERE max_points > 0 AND grade_id = ?"
+        return self._column(query + self._filter(latest), (grade_id,))
+
+    def score_distribution(self, grade_id: str = None, bins: int = 10, latest: bool = True):
+        """
+        Returns histogram counts and bin edges of normalized scores, as 'numpy.histogram'.
+        """
+        return np.histogram(self.scores(grade_id, latest), bins=bins, range=(0.0, 1.0))
+
+    def runtime_percentiles(self, q=(50, 90, 99), grade_id: str = None, latest: bool = True):
+        """
+        Returns percentiles @q of notebook grading time in seconds, or of test
+        runtimes within grade cell @grade_id.
+        """
+        if grade_id is None:
+            query = "SELECT elapsed FROM submissions WHERE elapsed IS NOT NULL"
+            query += " AND id IN (SELECT submission FROM latest)" if latest else ""
+            times = self._column(query)
+        else:
+            query = "SELECT elapsed FROM tests WHERE grade_id = ?"
+            times = self._column(query + self._filter(latest), (grade_id,))
+        if len(times) == 0:
+            return np.full(len(q), np.nan)
+        return np.percentile(times, q)
@@ -0,0 +1,112 @@
+import os
+import ast
+import json
+import marshal
+import hashlib
+from base64 import b64decode, b64encode
+from importlib.util import MAGIC_NUMBER
+from .journal import atomic_write
+
+# Bundles loaded in this process, keyed by path and stored with file modification time
+_loaded = {}
+
+
+def _compile_test(source: str, grade_id: str):
+    """
+    Compiles hidden test code like a notebook cell: the statements are compiled for
+    execution, and a final expression separately for evaluation, so that its value
+    can be returned as the cell result. Returns (body_code, expr_code_or_None).
+    """
+    filename = "<hidden tests %s>" % grade_id
+    tree = ast.parse(source, filename)
+    expr = None
+    if len(tree.body) > 0 and isinstance(tree.body[-1], ast.Expr):
+        expr = compile(ast.Expression(tree.body.pop().value), filename, "eval")
+    return compile(tree, filename, "exec"), expr
+
+
+class TestBundle:
+    """
+    Collection of the hidden tests of an assignment, keyed by nbgrader grade id.
+    Each entry holds the test source, its SHA-256 hash and, when the source can be
+    compiled, the marshalled code objects for the Python version that wrote the bundle.
+    Code objects are only used by the same Python version, otherwise the source is
+    compiled on first use.
+    """
+
+    def __init__(self, tests: dict = None, magic: bytes = MAGIC_NUMBER):
+        self.tests = {} if tests is None else tests
+        self.magic = magic
+        self._code = {}
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, 'r', encoding='utf-8') as f:
+            bundle = json.load(f)
+        return cls(bundle['tests'], b64decode(bundle['magic']))
+
+    def save(self, path: str):
+        atomic_write(path, json.dumps({'format': 1,
+                                       'magic': b64encode(self.magic).decode('utf-8'),
+                                       'tests': self.tests}, indent=1))
+
+    def add(self, grade_id: str, source: str, compile_code: bool = True):
+        """
+        Adds hidden test code @source for grade cell @grade_id to the bundle,
+        replacing any previous entry.
+        """
+        if self.magic != MAGIC_NUMBER:
+            # Code objects of other Python versions can not be mixed with new ones
+            for entry in self.tests.values():
+                entry.pop('code', None)
+            self.magic = MAGIC_NUMBER
+        entry = {'source': source, 'sha256': hashlib.sha256(source.encode('utf-8')).hexdigest()}
+        if compile_code:
+            try:
+                entry['code'] = b64encode(marshal.dumps(_compile_test(source, grade_id))).decode('utf-8')
+            except SyntaxError:
+                pass # Tests using IPython syntax are inserted as source instead
+        self.tests[grade_id] = entry
+        self._code.pop(grade_id, None)
+
+    def get_code(self, grade_id: str):
+        """
+        Returns compiled code objects (body_code, expr_code_or_None) for grade cell @grade_id.
+        """
+        if grade_id not in self._code:
+            entry = self.tests[grade_id]
+            if 'code' in entry and self.magic == MAGIC_NUMBER:
+                self._code[grade_id] = marshal.loads(b64decode(entry['code']))
+            else:
+                self._code[grade_id] = _compile_test(entry['source'], grade_id)
+        return self._code[grade_id]
+
+    def run(self, grade_id: str, namespace: dict):
+        """
+        Executes hidden tests for grade cell @grade_id in @namespace, and returns
+        the value of the final expression in the tests, if any.
+        """
+        body, expr = self.get_code(grade_id)
+        exec(body, namespace)
+        if expr is not None:
+            return eval(expr, namespace)
+
+
+def load_bundle(path: str):
+    """
+    Function to load the test bundle at 'path', reusing a previously loaded copy
+    as long as the file is unchanged.
+    """
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    if path not in _loaded or _loaded[path][0] != mtime:
+        _loaded[path] = (mtime, TestBundle.load(path))
+    return _loaded[path][1]
+
+
+def run_hidden_test(path: str, grade_id: str, namespace: dict):
+    """
+    Function inserted in grade cells to run the hidden tests of grade cell
+    'grade_id' from the test bundle at 'path' in notebook namespace 'namespace'.
+    """
+    return load_bundle(path).run(grade_id, namespace)
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import threading
+from .feedback_generator import notebook_fingerprint, directory_digest, grading_key, _read_notebook, _grade_group
+from .journal import atomic_write
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+
+
+class NotebookMonitor:
+    """
+    Class to detect changes to a set of notebook files. File system events are
+    used when the optional 'watchdog' package is installed (inotify on Linux),
+    otherwise file modification times and sizes are polled.
+    """
+
+    def __init__(self, notebook_list, interval: float = 1.0, use_events: bool = True):
+        self.paths = {os.path.abspath(nb): nb for nb in notebook_list}
+        self.interval = interval
+        self.changed = set()
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.observer = None
+        self.stats = {path: self._stat(path) for path in self.paths}
+        if use_events and Observer is not None:
+            monitor = self
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    for path in (event.src_path, getattr(event, 'dest_path', None)):
+                        if path is not None and os.path.abspath(path) in monitor.paths:
+                            with monitor.lock:
+                                monitor.changed.add(monitor.paths[os.path.abspath(path)])
+                            monitor.event.set()
+
+            self.observer = Observer()
+            for directory in {os.path.dirname(path) for path in self.paths}:
+                self.observer.schedule(Handler(), directory, recursive=False)
+            self.observer.start()
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changes(self, timeout: float = None):
+        """
+        Waits up to @timeout seconds (default: polling interval) for changes, and
+        returns the set of notebooks changed since the previous call.
+        """
+        timeout = self.interval if timeout is None else timeout
+        if self.observer is not None:
+            self.event.wait(timeout)
+            with self.lock:
+                changed, self.changed = self.changed, set()
+                self.event.clear()
+            return changed
+        time.sleep(timeout)
+        changed = set()
+        for path, nb in self.paths.items():
+            stat = self._stat(path)
+            if stat != self.stats[path]:
+                self.stats[path] = stat
+                changed.add(nb)
+        return changed
+
+    def close(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+
+
+def watch_notebooks(notebook_list, output_dir="test_results", timeout=30, interval=1.0, debounce=1.0,
+                    stop: threading.Event = None, callback=print, bundle=None, assets_dir=None):
+    """
+    Function to keep the feedback reports of the notebooks in 'notebook_list'
+    up to date while students work on them. A notebook is regraded once no
+    further saves have been seen for 'debounce' seconds, and only if its code,
+    hidden tests, data files or grading settings changed (see 'grading_key'),
+    so saves that only change markdown or whitespace are ignored. Scores are kept in
+    '<output_dir>/summary.json', which is rewritten after each regrade.
+    Notebooks whose code changed since the last entry in the summary are graded
+    on startup. Runs until interrupted or until event 'stop' is set, reporting
+    progress through 'callback'. Hidden tests are taken from test bundle
+    'bundle' when given, and report images are stored in 'assets_dir' when
+    given (see 'run_tests').
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summary_file = os.path.join(output_dir, "summary.json")
+    summary = {}
+    if os.path.exists(summary_file):
+        with open(summary_file, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+    stop = threading.Event() if stop is None else stop
+
+    def regrade(notebook):
+        try:
+            data_digest = directory_digest(os.path.dirname(notebook), [output_dir, assets_dir or output_dir])
+            key = grading_key(notebook_fingerprint(_read_notebook(notebook), data_digest, bundle), timeout)
+        except Exception as e:
+            # Notebook may be mid-save or invalid, wait for the next change
+            callback("%s could not be read: %s" % (notebook, repr(e)))
+            return
+        entry = summary.get(notebook)
+        if entry is not None and entry['fingerprint'] == key and os.path.exists(entry['report']):
+            return
+        outcome = _grade_group([notebook], output_dir, timeout, bundle=bundle, assets_dir=assets_dir)[0]
+        if outcome['status'] == "failed":
+            callback("%s could not be graded: %s" % (notebook, outcome['error']))
+            return
+        summary[notebook] = {'points': outcome['points'],
+                             'max_points': outcome['max_points'],
+                             'report': outcome['report'],
+                             'fingerprint': key,
+                             'graded_at': time.time()}
+        atomic_write(summary_file, json.dumps(summary, indent=1))
+        callback("%s graded, score: %s/%s (%.1f s). See %s for detailed report." %
+                 (notebook, outcome['points'], outcome['max_points'], outcome['elapsed'], outcome['report']))
+
+    monitor = NotebookMonitor(notebook_list, interval)
+    try:
+        for notebook in notebook_list:
+            regrade(notebook)
+        pending = {}
+        while not stop.is_set():
+            changed = monitor.changes()
+            now = time.monotonic()
+            for notebook in changed:
+                pending[notebook] = now
+            for notebook, changed_at in list(pending.items()):
+                if now - changed_at >= debounce:
+                    del pending[notebook]
+                    regrade(notebook)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.close()
+    return summary
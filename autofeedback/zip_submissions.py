@@ -0,0 +1,150 @@
+import io
+import os
+import shutil
+import hashlib
+import zipfile
+from contextlib import contextmanager
+from tempfile import TemporaryDirectory, mkdtemp
+
+# Zip archives opened by this process, by archive path. Archives are reopened
+# in worker processes, which must not share the file position of their parent.
+_open_archives = {}
+
+
+def split_zip_path(path):
+    """
+    Function to split notebook path 'path' into the path of a zip archive and
+    the name of a member in it, for paths like "submissions.zip/student/hw.ipynb".
+    Returns (None, None) for paths that are not inside a zip archive.
+    """
+    parts = path.replace(os.sep, "/").split("/")
+    for i in range(1, len(parts)):
+        archive = os.sep.join(parts[:i])
+        if archive.lower().endswith(".zip") and os.path.isfile(archive):
+            return archive, "/".join(parts[i:])
+    return None, None
+
+
+def _archive(archive):
+    zf, pid = _open_archives.get(archive, (None, None))
+    if zf is None or pid != os.getpid():
+        zf = zipfile.ZipFile(archive)
+        _open_archives[archive] = (zf, os.getpid())
+    return zf
+
+
+def zip_notebooks(archive):
+    """
+    Function to list the notebooks in zip archive 'archive' as notebook paths
+    below the archive path, sorted and skipping checkpoints and macOS metadata.
+    """
+    notebooks = []
+    for name in _archive(archive).namelist():
+        parts = name.split("/")
+        if name.endswith(".ipynb") and ".ipynb_checkpoints" not in parts and "__MACOSX" not in parts:
+            notebooks.append(os.path.join(archive, *parts))
+    return sorted(notebooks)
+
+
+def open_submission(filename):
+    """
+    Function to open notebook file 'filename' for binary reading, streaming it
+    from its zip archive if the path points inside one.
+    """
+    archive, member = split_zip_path(filename)
+    if archive is None:
+        return open(filename, 'rb')
+    return _archive(archive).open(member)
+
+
+def submission_digest(filename):
+    """
+    Function to compute the SHA-256 digest of notebook file 'filename', which
+    may be inside a zip archive.
+    """
+    h = hashlib.sha256()
+    with open_submission(filename) as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_submission(filename):
+    """
+    Function to read the text of notebook file 'filename', which may be inside
+    a zip archive.
+    """
+    with open_submission(filename) as f:
+        return io.TextIOWrapper(f, encoding='utf-8').read()
+
+
+def _data_members(archive, directory, recursive=False):
+    # Non-notebook members in 'directory' of the archive (and below it if 'recursive'),
+    # by path relative to the directory
+    prefix = "" if directory == "" else directory + "/"
+    for info in _archive(archive).infolist():
+        name = info.filename
+        if info.is_dir() or not name.startswith(prefix) or name.endswith(".ipynb"):
+            continue
+        parts = name[len(prefix):].split("/")
+        if "__MACOSX" in parts or ".ipynb_checkpoints" in parts or any(part in ("", ".", "..") for part in parts):
+            continue
+        if recursive or len(parts) == 1:
+            yield "/".join(parts), info
+
+
+def zip_data_digests(data_dir):
+    """
+    Function to compute the SHA-256 digests of the data files in directory
+    'data_dir' of a zip archive, given as "archive.zip/directory", and its
+    subdirectories. Returns a sorted list of (relative path, digest) tuples.
+    """
+    archive, directory = split_zip_path(os.path.join(data_dir, ""))
+    digests = []
+    for name, info in _data_members(archive, directory.rstrip("/"), recursive=True):
+        with _archive(archive).open(info) as f:
+            digests.append((name, hashlib.sha256(f.read()).hexdigest()))
+    return sorted(digests)
+
+
+def _extract_data(archive, directory, path):
+    for name, info in _data_members(archive, directory, recursive=True):
+        target = os.path.join(path, *name.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with _archive(archive).open(info) as src, open(target, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+
+@contextmanager
+def submission_dir(filename, extract_dir=None):
+    """
+    Context manager giving the directory notebook 'filename' is executed in.
+    For notebooks in a zip archive, the data files in the notebook's directory
+    in the archive and its subdirectories (the files covered by 'zip_data_digests')
+    are extracted. With 'extract_dir' given, each archive directory is extracted
+    once to a subdirectory of 'extract_dir', shared by all notebooks of that
+    directory and by concurrent grading processes, and left for the caller to
+    remove. Otherwise the files are extracted to a temporary directory, which
+    is removed afterwards. Other notebooks are executed in their own directory.
+    """
+    archive, member = split_zip_path(filename)
+    if archive is None:
+        yield os.path.dirname(filename) or "./"
+        return
+    directory = os.path.dirname(member)
+    if extract_dir is None:
+        with TemporaryDirectory(prefix="autofeedback-") as path:
+            _extract_data(archive, directory, path)
+            yield path
+        return
+    key = hashlib.sha256((os.path.abspath(archive) + "\0" + directory).encode('utf-8')).hexdigest()
+    path = os.path.join(extract_dir, key)
+    if not os.path.isdir(path):
+        # Extract next to the target and rename, so no process sees a partial extraction
+        tmp_path = mkdtemp(dir=extract_dir)
+        _extract_data(archive, directory, tmp_path)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    yield path
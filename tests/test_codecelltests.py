@@ -0,0 +1,20 @@
+from autofeedback.autotest import CodeCellTests
+
+
+def test_isolated_cell_keeps_student_bindings():
+    ns = {'__name__': __name__, 'N': 1}
+    test_obj = CodeCellTests("N = 5\nresult = N * 2", globals=ns, isolate=True)
+    test_obj.substitute("N", 10)
+    assert ns['result'] == 20
+    test_obj.get_results()
+    assert ns['N'] == 5
+    assert ns['result'] == 10
+
+
+def test_isolated_cell_undoes_in_place_changes_of_copied_names():
+    ns = {'__name__': __name__, 'values': [1, 2]}
+    test_obj = CodeCellTests("values.append(3)", globals=ns, isolate=True, copy_names=("values",))
+    test_obj.replace("3", "4")
+    assert ns['values'] == [1, 2, 3, 4]
+    test_obj.get_results()
+    assert ns['values'] == [1, 2, 3]
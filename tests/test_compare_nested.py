@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from autofeedback.autotest import compare_nested
+
+
+def test_nan_in_both_arrays_is_correct():
+    passed, msg = compare_nested(np.array([1.0, np.nan, 3.0]), np.array([1.0, np.nan, 3.0]))
+    assert passed, msg
+    passed, msg = compare_nested({'a': [1.0, float('nan')]}, {'a': [1.0, float('nan')]})
+    assert passed, msg
+
+
+def test_nan_in_one_array_is_incorrect():
+    passed, msg = compare_nested(np.array([1.0, np.nan]), np.array([1.0, 2.0]))
+    assert not passed
+    assert msg == "value[1] is nan, expected 2.0."
+
+
+def test_nan_in_both_frames_is_correct():
+    pd = pytest.importorskip("pandas")
+    df = pd.DataFrame({'x': [1.0, np.nan, 3.0], 'y': ["a", None, "c"]})
+    passed, msg = compare_nested(df, df.copy())
+    assert passed, msg
+    passed, msg = compare_nested(df.assign(x=[1.0, 2.0, 3.0]), df)
+    assert not passed
+    assert msg == "value['x'][1] is 2.0, expected nan."
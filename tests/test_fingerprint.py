@@ -0,0 +1,45 @@
+import os
+import zipfile
+from autofeedback.feedback_generator import directory_digest
+
+
+def make_submission(path, data, checkpoint="", report=""):
+    os.makedirs(os.path.join(path, "data"))
+    os.makedirs(os.path.join(path, ".ipynb_checkpoints"))
+    with open(os.path.join(path, "hw.ipynb"), 'w') as f:
+        f.write("{}")
+    with open(os.path.join(path, "data", "x.csv"), 'w') as f:
+        f.write(data)
+    with open(os.path.join(path, ".ipynb_checkpoints", "x.csv"), 'w') as f:
+        f.write(checkpoint)
+    if report:
+        os.makedirs(os.path.join(path, "test_results"))
+        with open(os.path.join(path, "test_results", "hw.html"), 'w') as f:
+            f.write(report)
+
+
+def test_files_in_subdirectories_are_included(tmp_path):
+    make_submission(tmp_path / "alice", "1,2,3")
+    make_submission(tmp_path / "bob", "4,5,6")
+    make_submission(tmp_path / "carol", "1,2,3", checkpoint="other")
+    assert directory_digest(str(tmp_path / "alice")) != directory_digest(str(tmp_path / "bob"))
+    assert directory_digest(str(tmp_path / "alice")) == directory_digest(str(tmp_path / "carol"))
+
+
+def test_excluded_directories_are_skipped(tmp_path):
+    make_submission(tmp_path / "alice", "1,2,3")
+    make_submission(tmp_path / "bob", "1,2,3", report="<html>")
+    assert directory_digest(str(tmp_path / "alice")) == \
+        directory_digest(str(tmp_path / "bob"), [str(tmp_path / "bob" / "test_results")])
+
+
+def test_zip_subdirectories_are_included(tmp_path):
+    archive = str(tmp_path / "subs.zip")
+    with zipfile.ZipFile(archive, 'w') as z:
+        for student, data in [("alice", "1,2,3"), ("bob", "4,5,6"), ("carol", "1,2,3")]:
+            z.writestr(student + "/hw.ipynb", "{}")
+            z.writestr(student + "/data/x.csv", data)
+        z.writestr("__MACOSX/carol/data/._x.csv", "junk")
+    digests = {student: directory_digest(os.path.join(archive, student)) for student in ("alice", "bob", "carol")}
+    assert digests["alice"] != digests["bob"]
+    assert digests["alice"] == digests["carol"]
@@ -0,0 +1,20 @@
+import sys
+import subprocess
+
+# Modules only needed on the grading host, which must not be loaded by kernels
+# importing autofeedback for hidden tests
+host_modules = ["nbconvert", "nbgrader", "nbformat", "nbclient", "matplotlib"]
+
+
+def test_import_does_not_load_grading_host_modules():
+    code = ("import sys, autofeedback\n"
+            "print(','.join(m for m in %r if m in sys.modules))" % host_modules)
+    loaded = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.strip()
+    assert loaded == ""
+
+
+def test_lazy_names_resolve():
+    import autofeedback
+    from autofeedback.feedback_generator import run_tests
+    assert autofeedback.run_tests is run_tests
+    assert set(autofeedback.__all__) <= set(dir(autofeedback))
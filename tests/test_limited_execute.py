@@ -0,0 +1,49 @@
+import nbformat
+import pytest
+from autofeedback.preprocessors import LimitedExecute
+
+pytest.importorskip("ipykernel")
+
+
+def _execute(*sources, **limits):
+    nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_code_cell(source) for source in sources])
+    LimitedExecute(timeout=30, kernel_name='python3', **limits).preprocess(nb, {})
+    return nb.cells
+
+
+def _text(outputs):
+    return "".join(output.get('text', "") for output in outputs)
+
+
+def test_stream_over_limit_keeps_head_and_tail():
+    cell, = _execute("for i in range(1000):\n    print('%04d' % i)", max_stream_chars=100)
+    text = _text(cell.outputs)
+    assert text.startswith("0000\n0001\n")
+    assert text.endswith("0998\n0999\n")
+    assert "characters of output omitted" in text
+    assert len(text) < 200
+
+
+def test_displays_over_limit_keep_head_tail_and_display_updates():
+    cell, update = _execute(
+        "from IPython.display import display\n"
+        "handle = display('first', display_id=True)\n"
+        "for i in range(20):\n    display(i)\n"
+        "last = display('last', display_id=True)",
+        "handle.update('first updated')\nlast.update('last updated')",
+        max_display_outputs=4)
+    data = [output['data']['text/plain'] for output in cell.outputs if output.output_type == 'display_data']
+    # Outputs with a display id are not limited, and keep receiving updates after the tail is inserted
+    assert data == ["'first updated'", "0", "1", "18", "19", "'last updated'"]
+    assert "[16 outputs omitted]" in _text(cell.outputs)
+    assert update.outputs == []
+
+
+def test_clear_output_wait_resets_limits():
+    cell, = _execute(
+        "from IPython.display import clear_output\n"
+        "for i in range(1000):\n    print('%04d' % i)\n"
+        "clear_output(wait=True)\nprint('done')",
+        max_stream_chars=100)
+    assert [output.output_type for output in cell.outputs] == ['stream']
+    assert _text(cell.outputs) == "done\n"
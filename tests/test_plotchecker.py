@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("matplotlib").use("Agg")
+import matplotlib.pyplot as plt
+from autofeedback.autotest import PlotChecker
+
+
+def plot_with_scatter():
+    fig, ax = plt.subplots()
+    x = np.linspace(0, 1, 20)
+    ax.plot(x, x**2)
+    ax.scatter(x, np.zeros_like(x))
+    return fig
+
+
+def test_function_checks_last_line_by_default():
+    checker = PlotChecker(plot_with_scatter())
+    checker.test_function(lambda x: x**2)
+    assert checker.score.test_results[-1]
+    checker.close()
+
+
+def test_function_checks_other_kinds_on_request():
+    checker = PlotChecker(plot_with_scatter())
+    checker.test_function(lambda x: 0*x, kind="scatter")
+    assert checker.score.test_results[-1]
+    checker.test_function(lambda x: x**2, kind="scatter")
+    assert not checker.score.test_results[-1]
+    checker.close()
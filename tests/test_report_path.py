@@ -0,0 +1,23 @@
+import os
+import pytest
+from autofeedback.feedback_generator import report_path, grade_notebooks
+
+
+def test_relative_directories_are_kept():
+    assert report_path(os.path.join("subs", "alice", "hw.ipynb")) == os.path.join("test_results", "subs", "alice", "hw.html")
+
+
+def test_absolute_and_parent_paths_do_not_collide():
+    alice = report_path(os.path.abspath(os.path.join(os.sep, "subs", "alice", "hw.ipynb")))
+    bob = report_path(os.path.abspath(os.path.join(os.sep, "subs", "bob", "hw.ipynb")))
+    assert alice != bob
+    assert alice.startswith("test_results" + os.sep) and bob.endswith(os.path.join("bob", "hw.html"))
+    parent_alice = report_path(os.path.join(os.pardir, "alice", "hw.ipynb"))
+    parent_bob = report_path(os.path.join(os.pardir, "bob", "hw.ipynb"))
+    assert parent_alice != parent_bob
+    assert os.pardir not in parent_alice.split(os.sep)
+
+
+def test_duplicate_reports_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        next(grade_notebooks(["hw.ipynb", os.path.join(".", "hw.ipynb")], str(tmp_path)))
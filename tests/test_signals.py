@@ -0,0 +1,42 @@
+import numpy as np
+from autofeedback.autotest import estimate_lag, compare_signals
+
+
+def _signals():
+    rng = np.random.default_rng(0)
+    y = rng.standard_normal(200)
+    x = np.concatenate((np.zeros(3), y[:-3])) # y delayed by 3 samples
+    return x, y
+
+
+def test_delayed_signal():
+    x, y = _signals()
+    lag, gain = estimate_lag(x, y)
+    assert lag == 3
+    assert np.isclose(gain, 1.0)
+    passed, msg = compare_signals(x, y)
+    assert passed, msg
+    assert "a lag of 3 samples" in msg
+
+
+def test_convolution_modes():
+    rng = np.random.default_rng(1)
+    x, h = rng.standard_normal(100), np.array([0.25, 0.5, 0.25, 0.1, -0.2])
+    full, same = np.convolve(x, h, "full"), np.convolve(x, h, "same")
+    assert len(full) != len(same)
+    passed, msg = compare_signals(same, full)
+    assert passed, msg
+    assert "a lag of -2 samples" in msg
+    passed, msg = compare_signals(full, same)
+    assert passed, msg
+
+
+def test_inverted_signal():
+    x, y = _signals()
+    lag, gain = estimate_lag(-2*x, y, fit_gain=True)
+    assert lag == 3
+    assert np.isclose(gain, -2.0)
+    passed, msg = compare_signals(-2*x, y, fit_gain=True)
+    assert passed, msg
+    passed, msg = compare_signals(-2*x, y)
+    assert not passed
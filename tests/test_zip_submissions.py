@@ -0,0 +1,33 @@
+import os
+import zipfile
+from autofeedback.zip_submissions import submission_dir
+
+
+def make_archive(path):
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr("alice/hw.ipynb", "{}")
+        z.writestr("alice/data/x.csv", "1,2,3")
+        z.writestr("alice/data/raw/y.csv", "4,5,6")
+        z.writestr("alice/.ipynb_checkpoints/hw-checkpoint.ipynb", "{}")
+        z.writestr("alice/data/.ipynb_checkpoints/x-checkpoint.csv", "old")
+        z.writestr("__MACOSX/alice/data/._x.csv", "junk")
+        z.writestr("bob/hw.ipynb", "{}")
+
+
+def extracted(path):
+    return sorted(os.path.relpath(os.path.join(root, name), path).replace(os.sep, "/")
+                  for root, _, names in os.walk(path) for name in names)
+
+
+def test_data_subdirectories_are_extracted(tmp_path):
+    archive = str(tmp_path / "subs.zip")
+    make_archive(archive)
+    with submission_dir(os.path.join(archive, "alice", "hw.ipynb")) as path:
+        assert extracted(path) == ["data/raw/y.csv", "data/x.csv"]
+        with open(os.path.join(path, "data", "x.csv")) as f:
+            assert f.read() == "1,2,3"
+    os.makedirs(tmp_path / "extract")
+    with submission_dir(os.path.join(archive, "alice", "hw.ipynb"), str(tmp_path / "extract")) as path:
+        assert extracted(path) == ["data/raw/y.csv", "data/x.csv"]
+    with submission_dir(os.path.join(archive, "bob", "hw.ipynb"), str(tmp_path / "extract")) as path:
+        assert extracted(path) == []